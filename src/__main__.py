@@ -0,0 +1,25 @@
+"""
+Builds or refreshes the columnar store of the source database.
+
+usage: python -m src [--force] [SOURCE] [STORE]
+"""
+
+import sys
+
+from src import load
+
+
+def main(argv: list) -> None:
+    force: bool = "--force" in argv
+    paths: list = [arg for arg in argv if arg != "--force"]
+    if paths:
+        load.Data.SOURCE = paths[0]
+    if len(paths) > 1:
+        load.Data.STORE = paths[1]
+    rebuilt: bool = load.Data.refresh_store(force)
+    print(("rebuilt " if rebuilt else "up to date ") + str(load.Data.STORE))
+    load.Data.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,266 @@
+"""
+A module of accumulators that describe a sample from chunks of data,
+in constant memory, so columns too large to hold at once can still be
+described.
+Moments keeps the count, mean and sum of squared deviations (M2),
+combining each chunk with Chan et al.'s pairwise update, which stays
+numerically stable where summing x and x**2 would cancel.
+Every accumulator is a small picklable dataclass with an exact merge,
+so shards or worker processes can each describe their own rows and
+map_reduce() combines the partial states into the final result.
+"""
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from functools import reduce
+from typing import Any, Callable, Iterable, List, Tuple
+
+import numpy as np
+from scipy import special, stats
+
+from src import compare, describe, proportion, summarise
+
+
+@dataclass
+class Moments():
+    """
+    A dataclass to hold the running count, mean and M2 of a sample.
+    """
+    label: str = "Sample"
+    size: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    def update(self, x: Iterable[float]) -> "Moments":
+        """
+        folds the chunk x into the running moments, ignoring NaNs
+        :return: self, for chaining
+        """
+        x = np.asarray(x, dtype=np.float64).ravel()
+        x = x[~np.isnan(x)]
+        if x.size:
+            mean: float = float(x.mean())
+            self._combine(x.size, mean, float(np.sum((x - mean)**2)))
+        return self
+
+    def merge(self, other: "Moments") -> "Moments":
+        """
+        :return: the Moments of this sample and other together
+        """
+        res: Moments = replace(self)
+        if other.size:
+            res._combine(other.size, other.mean, other.m2)
+        return res
+
+    def __add__(self, other: "Moments") -> "Moments":
+        return self.merge(other)
+
+    def _combine(self, size: int, mean: float, m2: float) -> None:
+        """
+        combines the moments of another sample into these
+        """
+        total: int = self.size + size
+        delta: float = mean - self.mean
+        self.m2 += m2 + delta**2 * self.size * size / total
+        self.mean += delta * size / total
+        self.size = total
+
+    @property
+    def var(self) -> float:
+        """
+        :return: the sample variance (ddof=1)
+        """
+        return self.m2 / (self.size - 1) if self.size > 1 else np.nan
+
+    @property
+    def std_mean(self) -> float:
+        """
+        :return: the standard error of the mean
+        """
+        return np.sqrt(self.var / self.size) if self.size else np.nan
+
+    def tconfint_mean(self, alpha: float = 0.05) -> Tuple[float, float]:
+        """
+        :return: the 1 - alpha t-interval for the mean
+        """
+        q: float = stats.t(self.size - 1).isf(alpha / 2)
+        return (self.mean - q * self.std_mean, self.mean + q * self.std_mean)
+
+    def zconfint_mean(self, alpha: float = 0.05) -> Tuple[float, float]:
+        """
+        :return: the 1 - alpha z-interval for the mean
+        """
+        q: float = -special.ndtri(alpha / 2)
+        return (self.mean - q * self.std_mean, self.mean + q * self.std_mean)
+
+    def tsample(self, alpha: float = 0.05) -> describe.TSample:
+        """
+        :return: the moments so far as a describe.TSample
+        """
+        return describe.TSample(
+            self.label, self.size, self.mean, self.tconfint_mean(alpha))
+
+    def zsample(self, alpha: float = 0.05) -> describe.ZSample:
+        """
+        :return: the moments so far as a describe.ZSample
+        """
+        return describe.ZSample(
+            self.label, self.size, self.mean, self.zconfint_mean(alpha))
+
+    def from_chunks(chunks: Iterable, column: str = None,
+                    label: str = "Sample") -> "Moments":
+        """
+        Describes a column streamed in chunks, e.g. from
+        load.Data.blocks(tbl, [column]) or load.Data.chunks(tbl).
+        :param column: the column to take from each chunk, or None if
+        the chunks are arrays
+        :return: the Moments of every chunk
+        """
+        acc: Moments = Moments(label)
+        for chunk in chunks:
+            acc.update(chunk if column is None else chunk[column])
+        return acc
+
+
+@dataclass
+class Binomial():
+    """
+    A dataclass to hold the running number of successes and trials of
+    a sample of 0/1 outcomes.
+    """
+    count: int = 0
+    nobs: int = 0
+
+    def update(self, x: Iterable[Any]) -> "Binomial":
+        """
+        folds the chunk x of outcomes, truthy for a success, into the
+        running counts
+        :return: self, for chaining
+        """
+        x = np.asarray(x).ravel()
+        self.count += int(np.count_nonzero(x))
+        self.nobs += x.size
+        return self
+
+    def merge(self, other: "Binomial") -> "Binomial":
+        """
+        :return: the counts of this sample and other together
+        """
+        return Binomial(self.count + other.count, self.nobs + other.nobs)
+
+    def __add__(self, other: "Binomial") -> "Binomial":
+        return self.merge(other)
+
+    def proportion(self, alpha: float = 0.05,
+                   method: str = "normal") -> describe.Proportion:
+        """
+        :return: the counts so far as a describe.Proportion
+        """
+        lower, upper = proportion.confint(self.count, self.nobs, alpha, method)
+        return describe.Proportion(
+            self.count / self.nobs, (float(lower), float(upper)))
+
+    def ztest(self, value: float = 0.5, alternative: str = "two-sided",
+              prop_var: float = False) -> summarise.PropTest:
+        """
+        :return: the z-test of the proportion == value
+        """
+        zstat, pval = proportion.ztest(
+            self.count, self.nobs, value, alternative, prop_var)
+        return summarise.PropTest(float(zstat), float(pval))
+
+
+@dataclass
+class Frequencies():
+    """
+    A dataclass to hold the running frequency of each distinct value,
+    or of each combination of values across several columns, as used
+    for rank and contingency statistics.
+    """
+    counts: Counter = field(default_factory=Counter)
+
+    def update(self, *columns: Iterable[Any]) -> "Frequencies":
+        """
+        folds one chunk into the running frequencies. Given several
+        columns, their values are counted together, row by row.
+        :return: self, for chaining
+        """
+        if len(columns) == 1:
+            values, freq = np.unique(
+                np.asarray(columns[0]).ravel(), return_counts=True)
+            keys: Iterable[Any] = values.tolist()
+        else:
+            rows: np.ndarray = np.rec.fromarrays(
+                [np.asarray(col).ravel() for col in columns])
+            values, freq = np.unique(rows, return_counts=True)
+            keys = [tuple(row) for row in values.tolist()]
+        self.counts.update(dict(zip(keys, freq.tolist())))
+        return self
+
+    def merge(self, other: "Frequencies") -> "Frequencies":
+        """
+        :return: the frequencies of this sample and other together
+        """
+        return Frequencies(self.counts + other.counts)
+
+    def __add__(self, other: "Frequencies") -> "Frequencies":
+        return self.merge(other)
+
+    def table(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: the distinct values, sorted, and their frequencies
+        """
+        keys: List[Any] = sorted(self.counts)
+        values: np.ndarray = np.empty(len(keys), dtype=object)
+        values[:] = keys
+        if not any(isinstance(k, tuple) for k in keys):
+            values = np.asarray(keys)
+        return values, np.array([self.counts[k] for k in keys], np.int64)
+
+
+def merge_all(states: Iterable[Any]) -> Any:
+    """
+    :return: the merge of every partial state in states
+    """
+    states = iter(states)
+    first: Any = next(states, None)
+    if first is None:
+        raise ValueError("there are no partial states to merge")
+    return reduce(lambda a, b: a.merge(b), states, first)
+
+
+def map_reduce(func: Callable[[Any], Any], shards: Iterable[Any],
+               workers: int = None) -> Any:
+    """
+    Runs func on each shard in a process pool, e.g. a table chunk or
+    the path of an sqlite shard, and merges the partial states it
+    returns. Only the compact states cross between processes.
+    :param func: a picklable, module-level function of one shard
+    returning Moments, Binomial or Frequencies
+    :return: the merged state
+    """
+    with ProcessPoolExecutor(workers) as ex:
+        return merge_all(ex.map(func, shards))
+
+
+def compare_moments(m1: Moments, m2: Moments, alpha: float = 0.05,
+                    test: str = "t", usevar: str = "pooled",
+                    alternative: str = "two-sided") -> Tuple[Any, Any]:
+    """
+    Compares the means of two independent samples from their moments,
+    as compare.compare.
+    :return: a describe.TDiff and summarise.TTest, or a describe.ZDiff
+    and summarise.ZTest
+    """
+    std, dof = compare._std_err(m1.size, m2.size, m1.var, m2.var, usevar)
+    diff: float = m1.mean - m2.mean
+    stat, pval, lower, upper = (
+        float(v) for v in compare._intervals(
+            np.float64(diff), np.float64(std), np.float64(dof), alpha, test,
+            alternative))
+    if test == "t":
+        return (describe.TDiff(diff, (lower, upper)),
+                summarise.TTest(stat, pval, dof))
+    return (describe.ZDiff(diff, (lower, upper)),
+            summarise.ZTest(stat, pval))
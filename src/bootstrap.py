@@ -0,0 +1,232 @@
+"""
+A module of bootstrap confidence intervals for means, medians, mean
+differences and regression slopes.
+Resamples are drawn as matrices of indices, a bounded block at a time,
+and may be spread over a process pool with an independent seeded
+random stream per task. Percentile, basic and BCa intervals are
+returned in the describe dataclasses, the statistic taking the place
+of the mean.
+"""
+
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+from scipy import special
+
+from src import describe, util
+
+METHODS: Tuple[str, ...] = ("percentile", "basic", "bca")
+# nboot is split into at least this many tasks, so a pool has work to
+# spread however small the sample
+MIN_TASKS: int = 64
+
+Data = Tuple[np.ndarray, ...]
+
+
+def _slope(x: np.ndarray, y: np.ndarray, origin: bool) -> np.ndarray:
+    """
+    :return: the least squares slope of y on x along the last axis,
+    through the origin if origin
+    """
+    if not origin:
+        x = x - x.mean(axis=-1, keepdims=True)
+        y = y - y.mean(axis=-1, keepdims=True)
+    return (x * y).sum(axis=-1) / (x * x).sum(axis=-1)
+
+
+def _statistic(kind: str, data: Data,
+               rng: np.random.Generator, size: int) -> np.ndarray:
+    """
+    :return: the statistic of size resamples of data
+    """
+    if kind == "mean_diff":
+        x1, x2 = data
+        i1: np.ndarray = rng.integers(0, x1.size, (size, x1.size))
+        i2: np.ndarray = rng.integers(0, x2.size, (size, x2.size))
+        return x1[i1].mean(axis=1) - x2[i2].mean(axis=1)
+    idx: np.ndarray = rng.integers(0, data[0].size, (size, data[0].size))
+    if kind == "mean":
+        return data[0][idx].mean(axis=1)
+    if kind == "median":
+        return np.median(data[0][idx], axis=1)
+    x, y = data
+    return _slope(x[idx], y[idx], kind == "origin_slope")
+
+
+def _replicates(sample: Tuple[str, Data], seed: np.random.SeedSequence,
+                size: int) -> np.ndarray:
+    """
+    :param sample: the kind of statistic and its data
+    :return: size bootstrap replicates of the statistic
+    """
+    kind, data = sample
+    return _statistic(kind, data, np.random.default_rng(seed), size)
+
+
+def distribution(kind: str, data: Data, nboot: int = 10_000,
+                 workers: int = None, seed: int = None) -> np.ndarray:
+    """
+    :param kind: one of "mean", "median", "mean_diff", "slope" or
+    "origin_slope"
+    :param data: (x,) for "mean" and "median", (x1, x2) for
+    "mean_diff", (x, y) for the slopes
+    :param workers: processes to spread resamples over, 1 if None
+    :param seed: seeds every random stream, for reproducible results
+    :return: nboot bootstrap replicates of the statistic
+    """
+    if kind not in _ESTIMATES:
+        raise ValueError(f"kind must be one of {tuple(_ESTIMATES)}")
+    data = tuple(np.asarray(d, dtype=np.float64).ravel() for d in data)
+    # fixed-size tasks, each with its own stream, so the replicates
+    # for a seed do not depend on workers
+    width: int = sum(d.size for d in data)
+    task: int = max(1, min(-(-nboot // MIN_TASKS),
+                           util.BLOCK_CELLS // width))
+    sizes: List[int] = [
+        min(task, nboot - start) for start in range(0, nboot, task)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    pool: Executor = util.executor(workers, (kind, data))
+    try:
+        return np.concatenate(util.run(
+            _replicates, (kind, data), list(zip(seeds, sizes)), pool))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def _jackknife(kind: str, data: Data) -> Tuple[np.ndarray, ...]:
+    """
+    :return: the leave-one-out estimates of the statistic, one array
+    per sample resampled separately, computed in O(n) (O(n log n) for
+    the median) rather than n separate fits
+    """
+    if kind == "mean_diff":
+        x1, x2 = data
+        loo1: np.ndarray = (x1.sum() - x1) / (x1.size - 1)
+        loo2: np.ndarray = (x2.sum() - x2) / (x2.size - 1)
+        return (loo1 - x2.mean(), x1.mean() - loo2)
+    x: np.ndarray = data[0]
+    n: int = x.size
+    if kind == "mean":
+        return ((x.sum() - x) / (n - 1),)
+    if kind == "median":
+        s: np.ndarray = np.sort(x)
+        i: np.ndarray = np.arange(n)[:, None]
+        # position k of the sample without s[i] is s[k] or s[k + 1]
+        k: np.ndarray = np.array([(n - 2) // 2, (n - 1) // 2])[None, :]
+        return (s[k + (k >= i)].mean(axis=1),)
+    y: np.ndarray = data[1]
+    sxx, sxy = (x * x).sum() - x * x, (x * y).sum() - x * y
+    if kind == "origin_slope":
+        return (sxy / sxx,)
+    sx, sy = (x.sum() - x) / (n - 1), (y.sum() - y) / (n - 1)
+    return ((sxy - (n - 1) * sx * sy) / (sxx - (n - 1) * sx * sx),)
+
+
+_ESTIMATES: Dict[str, Callable[[Data], float]] = {
+    "mean": lambda d: d[0].mean(),
+    "median": lambda d: np.median(d[0]),
+    "mean_diff": lambda d: d[0].mean() - d[1].mean(),
+    "slope": lambda d: _slope(d[0], d[1], False),
+    "origin_slope": lambda d: _slope(d[0], d[1], True),
+}
+
+
+def interval(boot: np.ndarray, estimate: float, alpha: float = 0.05,
+             method: str = "bca",
+             jack: Sequence[np.ndarray] = None) -> Tuple[float, float]:
+    """
+    :param method: "percentile", "basic" or "bca"
+    :param jack: the jackknife estimates, needed for "bca", one array
+    per sample resampled separately
+    :return: the 1 - alpha bootstrap interval of replicates boot
+    """
+    q: np.ndarray = np.array([alpha / 2, 1 - alpha / 2])
+    if method == "percentile":
+        return tuple(np.quantile(boot, q))
+    if method == "basic":
+        lo, hi = np.quantile(boot, q[::-1])
+        return (2 * estimate - lo, 2 * estimate - hi)
+    if method != "bca":
+        raise ValueError(f"method must be one of {METHODS}")
+    # replicates tied with the estimate count half below, as
+    # percentileofscore(kind="mean") and scipy.stats.bootstrap since
+    # 1.10; counting them all above biases z0 down when ties are
+    # common, e.g. for the median of a small sample
+    below: float = (np.sum(boot < estimate) + np.sum(boot == estimate) / 2)
+    z0: float = special.ndtri(below / boot.size)
+    if isinstance(jack, np.ndarray):
+        jack = (jack,)
+    # the acceleration sums the influence of each sample, U_ji / n_j
+    num, den = 0.0, 0.0
+    for loo in jack:
+        dev: np.ndarray = (loo.mean() - loo) * (loo.size - 1) / loo.size
+        num += np.sum(dev**3)
+        den += np.sum(dev**2)
+    a: float = num / (6 * den**1.5) if den > 0 else 0.0
+    z: np.ndarray = special.ndtri(q)
+    adj: np.ndarray = special.ndtr(z0 + (z0 + z) / (1 - a * (z0 + z)))
+    return tuple(np.quantile(boot, adj))
+
+
+def _fit(kind: str, data: Data, nboot: int, alpha: float, method: str,
+         workers: int, seed: int) -> Tuple[float, Tuple[float, float]]:
+    """
+    :return: the estimate of the statistic and its bootstrap interval
+    """
+    data = tuple(np.asarray(d, dtype=np.float64).ravel() for d in data)
+    boot: np.ndarray = distribution(kind, data, nboot, workers, seed)
+    estimate: float = float(_ESTIMATES[kind](data))
+    jack: Tuple[np.ndarray, ...] = _jackknife(kind, data) \
+        if method == "bca" else None
+    lo, hi = interval(boot, estimate, alpha, method, jack)
+    return estimate, (float(lo), float(hi))
+
+
+def mean(x: np.ndarray, label: str = "Sample", nboot: int = 10_000,
+         alpha: float = 0.05, method: str = "bca", workers: int = None,
+         seed: int = None) -> describe.TSample:
+    """
+    :return: the mean of x, with its bootstrap interval in place of the
+    t-interval
+    """
+    est, ci = _fit("mean", (x,), nboot, alpha, method, workers, seed)
+    return describe.TSample(label, np.size(x), est, ci)
+
+
+def median(x: np.ndarray, label: str = "Sample", nboot: int = 10_000,
+           alpha: float = 0.05, method: str = "bca", workers: int = None,
+           seed: int = None) -> describe.TSample:
+    """
+    :return: the median of x, in place of the mean, with its bootstrap
+    interval
+    """
+    est, ci = _fit("median", (x,), nboot, alpha, method, workers, seed)
+    return describe.TSample(label, np.size(x), est, ci)
+
+
+def mean_diff(x1: np.ndarray, x2: np.ndarray, nboot: int = 10_000,
+              alpha: float = 0.05, method: str = "bca", workers: int = None,
+              seed: int = None) -> describe.TDiff:
+    """
+    :return: mean(x1) - mean(x2), with its bootstrap interval from
+    resampling each sample separately
+    """
+    est, ci = _fit("mean_diff", (x1, x2), nboot, alpha, method, workers,
+                   seed)
+    return describe.TDiff(est, ci)
+
+
+def slope(x: np.ndarray, y: np.ndarray, origin: bool = False,
+          label: str = "Slope", nboot: int = 10_000, alpha: float = 0.05,
+          method: str = "bca", workers: int = None,
+          seed: int = None) -> describe.TSample:
+    """
+    :param origin: fit the line through the origin
+    :return: the least squares slope of y on x, in place of the mean,
+    with its bootstrap interval from resampling (x, y) pairs
+    """
+    kind: str = "origin_slope" if origin else "slope"
+    est, ci = _fit(kind, (x, y), nboot, alpha, method, workers, seed)
+    return describe.TSample(label, np.size(x), est, ci)
@@ -0,0 +1,223 @@
+"""
+A module for comparing the means of many groups at once.
+A long-format table (one value per row, labelled by group and, for
+paired designs, by a pairing key) is reduced to per-group sufficient
+statistics in one pass, and every requested pair of groups is then
+tested together, matching statsmodels CompareMeans at each pair.
+Results are returned as columnar pd.DataFrames; samples(), diffs() and
+tests() turn their rows into describe and summarise dataclasses.
+"""
+
+from itertools import combinations
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import special, stats
+
+from src import describe, summarise
+from src.proportion import ALTERNATIVES
+
+Pairs = Sequence[Tuple[str, str]]
+
+
+def moments(table: pd.DataFrame, value: str, group: str) -> pd.DataFrame:
+    """
+    :return: a pd.DataFrame indexed by group with columns size, mean
+    and var (ddof=1) of value, computed in one pass
+    """
+    codes, labels = pd.factorize(table[group], sort=True)
+    x: np.ndarray = table[value].to_numpy(dtype=np.float64)
+    keep: np.ndarray = (codes >= 0) & ~np.isnan(x)
+    codes, x = codes[keep], x[keep]
+    k: int = len(labels)
+    size: np.ndarray = np.bincount(codes, minlength=k).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean: np.ndarray = np.bincount(codes, x, minlength=k) / size
+        # centred second pass, stable where sum(x**2) would cancel
+        m2: np.ndarray = np.bincount(codes, (x - mean[codes])**2, minlength=k)
+        var: np.ndarray = m2 / (size - 1)
+    return pd.DataFrame(
+        {"size": size, "mean": mean, "var": var},
+        index=pd.Index(labels, name=group))
+
+
+def _intervals(est: np.ndarray, std: np.ndarray, dof: np.ndarray,
+               alpha: float, test: str, alternative: str,
+               value: float = 0) -> Tuple[np.ndarray, ...]:
+    """
+    :return: the statistics, p-values and 1 - alpha interval bounds for
+    estimates est with standard errors std, against the t distribution
+    on dof degrees of freedom or the standard normal. The interval is
+    one-sided if the alternative is, open above for "larger" and below
+    for "smaller", as statsmodels
+    """
+    if alternative not in ALTERNATIVES:
+        raise ValueError(f"alternative must be one of {ALTERNATIVES}")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stat: np.ndarray = (est - value) / std
+    tail: float = alpha / 2 if alternative == "two-sided" else alpha
+    if test == "t":
+        sf = stats.t(dof).sf
+        q: np.ndarray = stats.t(dof).isf(tail)
+    elif test == "z":
+        def sf(x):
+            return special.ndtr(-x)
+        q = -special.ndtri(tail)
+    else:
+        raise ValueError("test must be one of ('t', 'z')")
+    lower: np.ndarray = est - q * std
+    upper: np.ndarray = est + q * std
+    if alternative == "two-sided":
+        pval: np.ndarray = 2 * sf(np.abs(stat))
+    elif alternative == "larger":
+        pval = sf(stat)
+        upper = np.full(np.shape(upper), np.inf)
+    else:
+        pval = sf(-stat)
+        lower = np.full(np.shape(lower), -np.inf)
+    return stat, pval, lower, upper
+
+
+def _std_err(n1: np.ndarray, n2: np.ndarray, v1: np.ndarray,
+             v2: np.ndarray, usevar: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the standard error of the difference in means of
+    independent samples of sizes n1, n2 and variances v1, v2, and its
+    degrees of freedom, pooled or Welch-Satterthwaite if usevar is
+    "unequal"
+    """
+    if usevar == "pooled":
+        dof: np.ndarray = n1 + n2 - 2
+        pooled: np.ndarray = ((n1 - 1) * v1 + (n2 - 1) * v2) / dof
+        return np.sqrt(pooled * (1 / n1 + 1 / n2)), dof
+    if usevar == "unequal":
+        a, b = v1 / n1, v2 / n2
+        dof = (a + b)**2 / (a**2 / (n1 - 1) + b**2 / (n2 - 1))
+        return np.sqrt(a + b), dof
+    raise ValueError("usevar must be one of ('pooled', 'unequal')")
+
+
+def describe_groups(table: pd.DataFrame, value: str, group: str,
+                    alpha: float = 0.05, test: str = "t") -> pd.DataFrame:
+    """
+    :return: moments() of each group plus the lower and upper bounds of
+    the 1 - alpha t- or z-interval for its mean
+    """
+    res: pd.DataFrame = moments(table, value, group)
+    std: np.ndarray = np.sqrt(res["var"] / res["size"]).to_numpy()
+    _, _, res["lower"], res["upper"] = _intervals(
+        res["mean"].to_numpy(), std, res["size"].to_numpy() - 1,
+        alpha, test, "two-sided")
+    return res
+
+
+def compare(table: pd.DataFrame, value: str, group: str,
+            pairs: Union[Pairs, None] = None, key: str = None,
+            alpha: float = 0.05, test: str = "t", usevar: str = "pooled",
+            alternative: str = "two-sided") -> pd.DataFrame:
+    """
+    Tests the difference in mean value between each pair of groups.
+    :param pairs: (group1, group2) pairs to compare, every pair if None
+    :param key: the pairing key of a paired design; the groups are then
+    compared through the differences of values sharing a key
+    :param test: "t" or "z"
+    :param usevar: "pooled" or "unequal" (Welch) variance, for
+    independent samples, as statsmodels CompareMeans
+    :return: a pd.DataFrame with columns group1, group2, size1, size2,
+    mean_diff, lower, upper, stat, pval and dof, one row per pair
+    """
+    if key is not None:
+        return _paired(table, value, group, key, pairs, alpha, test,
+                       alternative)
+    mom: pd.DataFrame = moments(table, value, group)
+    i, j = _pair_index(mom.index, pairs)
+    n1, n2 = mom["size"].to_numpy()[i], mom["size"].to_numpy()[j]
+    v1, v2 = mom["var"].to_numpy()[i], mom["var"].to_numpy()[j]
+    diff: np.ndarray = mom["mean"].to_numpy()[i] - mom["mean"].to_numpy()[j]
+    std, dof = _std_err(n1, n2, v1, v2, usevar)
+    stat, pval, lower, upper = _intervals(
+        diff, std, dof, alpha, test, alternative)
+    return pd.DataFrame({
+        "group1": mom.index[i], "group2": mom.index[j],
+        "size1": n1, "size2": n2, "mean_diff": diff,
+        "lower": lower, "upper": upper, "stat": stat, "pval": pval,
+        "dof": dof})
+
+
+def _pair_index(labels: pd.Index,
+                pairs: Union[Pairs, None]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the positions in labels of the first and second group of
+    each pair
+    """
+    if pairs is None:
+        idx: np.ndarray = np.array(
+            list(combinations(range(len(labels)), 2)), dtype=np.intp)
+        return idx[:, 0], idx[:, 1]
+    first, second = zip(*pairs) if pairs else ((), ())
+    i: np.ndarray = labels.get_indexer(list(first))
+    j: np.ndarray = labels.get_indexer(list(second))
+    if (i < 0).any() or (j < 0).any():
+        raise KeyError("pairs name groups not in the table")
+    return i, j
+
+
+def _paired(table: pd.DataFrame, value: str, group: str, key: str,
+            pairs: Union[Pairs, None], alpha: float, test: str,
+            alternative: str) -> pd.DataFrame:
+    """
+    :return: compare() for a paired design, from the differences of the
+    values of each pair of groups sharing a key
+    """
+    wide: pd.DataFrame = table.pivot(index=key, columns=group, values=value)
+    wide = wide.sort_index(axis=1)
+    i, j = _pair_index(wide.columns, pairs)
+    x: np.ndarray = wide.to_numpy(dtype=np.float64)
+    d: np.ndarray = x[:, i] - x[:, j]
+    n: np.ndarray = np.sum(~np.isnan(d), axis=0).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        diff: np.ndarray = np.nansum(d, axis=0) / n
+        var: np.ndarray = np.nansum((d - diff)**2, axis=0) / (n - 1)
+    stat, pval, lower, upper = _intervals(
+        diff, np.sqrt(var / n), n - 1, alpha, test, alternative)
+    return pd.DataFrame({
+        "group1": wide.columns[i], "group2": wide.columns[j],
+        "size1": n, "size2": n, "mean_diff": diff,
+        "lower": lower, "upper": upper, "stat": stat, "pval": pval,
+        "dof": n - 1})
+
+
+def samples(table: pd.DataFrame, test: str = "t") -> List[describe.Sample]:
+    """
+    :return: a describe.TSample, or ZSample, for each row of a
+    describe_groups table
+    """
+    cls = describe.TSample if test == "t" else describe.ZSample
+    return [
+        cls(str(label), row["size"], row["mean"],
+            (row["lower"], row["upper"]))
+        for label, row in table.iterrows()]
+
+
+def diffs(table: pd.DataFrame, test: str = "t") -> List[describe.Diff]:
+    """
+    :return: a describe.TDiff, or ZDiff, for each row of a compare table
+    """
+    cls = describe.TDiff if test == "t" else describe.ZDiff
+    return [
+        cls(d, (lo, hi))
+        for d, lo, hi in zip(
+            table["mean_diff"], table["lower"], table["upper"])]
+
+
+def tests(table: pd.DataFrame, test: str = "t") -> List[object]:
+    """
+    :return: a summarise.TTest, or ZTest, for each row of a compare table
+    """
+    if test == "t":
+        return [
+            summarise.TTest(s, p, d)
+            for s, p, d in zip(table["stat"], table["pval"], table["dof"])]
+    return [
+        summarise.ZTest(s, p) for s, p in zip(table["stat"], table["pval"])]
@@ -0,0 +1,185 @@
+"""
+A module for tests of independence in contingency tables, many tables
+at once.
+crosstab() counts the cells inside sqlite with one GROUP BY, so only
+one row per cell leaves the database, and stacks the tables into an
+array of shape (tables, rows, columns), padded with zeros.
+Chi-square and G tests, with checks of the expected counts, and
+Fisher's exact test of 2 x 2 tables, then work across every table in
+one NumPy pass.
+"""
+
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from src import load, summarise
+from src.proportion import ALTERNATIVES
+
+METHODS: Tuple[str, ...] = ("pearson", "g")
+
+
+def crosstab(tbl: str, rows: str, cols: Union[str, Dict[str, str]],
+             by: str = None, weight: str = None,
+             where: Union[str, Dict[str, Any]] = None,
+             params: Sequence[Any] = ()
+             ) -> Tuple[np.ndarray, List[Any], List[Any], List[Any]]:
+    """
+    Counts rows of tbl by rows x cols, one table per value of by.
+    :param cols: a column, or a dict of column label -> SQL condition,
+    e.g. {"home": "homegoals > awaygoals", "draw": ...}
+    :param by: the column to split tables by, or None for one table
+    :param weight: a column of counts to sum, e.g. "count" for a table
+    already aggregated, or None to count rows
+    :param where: rows to include, as load.Data.get
+    :return: the counts, of shape (tables, rows, columns), and the
+    labels of the tables, rows and columns, each sorted
+    """
+    keys: List[str] = ([by] if by else []) + [rows]
+    if isinstance(cols, dict):
+        values: Dict[str, str] = {
+            label: cond if weight is None
+            else f"{load._quote(weight)} * ({cond})"
+            for label, cond in cols.items()}
+        agg: pd.DataFrame = load.Data.aggregate(
+            tbl, keys, values, ("sum",), where, params)
+        agg = agg.melt(
+            keys, [f"{label}_sum" for label in cols], "_col", "_n")
+        agg["_col"] = agg["_col"].str[:-len("_sum")]
+        col_levels: List[Any] = list(cols)
+    else:
+        keys.append(cols)
+        agg = load.Data.aggregate(
+            tbl, keys, [weight] if weight else [],
+            ("sum",) if weight else (), where, params)
+        agg = agg.rename(columns={
+            cols: "_col", f"{weight}_sum" if weight else "n": "_n"})
+        col_levels = sorted(agg["_col"].unique().tolist())
+    tables: List[Any] = sorted(agg[by].unique().tolist()) if by else [None]
+    row_levels: List[Any] = sorted(agg[rows].unique().tolist())
+    t: np.ndarray = np.searchsorted(tables, agg[by]) if by \
+        else np.zeros(len(agg), dtype=np.intp)
+    counts: np.ndarray = np.zeros(
+        (len(tables), len(row_levels), len(col_levels)))
+    np.add.at(counts, (
+        t, np.searchsorted(row_levels, agg[rows]),
+        pd.Index(col_levels).get_indexer(agg["_col"])), agg["_n"])
+    return counts, tables, row_levels, col_levels
+
+
+def expected(observed: np.ndarray) -> np.ndarray:
+    """
+    :return: the expected counts of each table of observed under
+    independence, from its margins
+    """
+    observed = np.asarray(observed, dtype=np.float64)
+    total: np.ndarray = observed.sum(axis=(-2, -1), keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.nan_to_num(
+            observed.sum(axis=-1, keepdims=True)
+            * observed.sum(axis=-2, keepdims=True) / total)
+
+
+def independence(observed: np.ndarray, method: str = "pearson",
+                 correction: bool = True,
+                 min_expected: float = 5.0) -> pd.DataFrame:
+    """
+    Tests independence of the rows and columns of each table, as
+    scipy.stats.chi2_contingency. Rows or columns of a table that are
+    all zero, e.g. padding, are left out of it.
+    :param observed: counts, of shape (rows, columns) or (tables, rows,
+    columns)
+    :param method: "pearson" (chi-square) or "g" (log-likelihood ratio)
+    :param correction: apply Yates' correction to tables with one
+    degree of freedom
+    :return: a pd.DataFrame with columns stat, pval, dof, min_expected
+    (the smallest expected count), small (the share of cells expected
+    fewer than min_expected) and valid (Cochran's rule: no expected
+    count below 1 and at most 20% below min_expected), one row per
+    table
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}")
+    observed = np.asarray(observed, dtype=np.float64)
+    observed = observed.reshape((-1,) + observed.shape[-2:])
+    exp: np.ndarray = expected(observed)
+    used_rows: np.ndarray = (observed.sum(axis=2) > 0).sum(axis=1)
+    used_cols: np.ndarray = (observed.sum(axis=1) > 0).sum(axis=1)
+    dof: np.ndarray = np.maximum(used_rows - 1, 0) \
+        * np.maximum(used_cols - 1, 0)
+    cells: np.ndarray = exp > 0
+    obs: np.ndarray = observed
+    if correction:
+        # move each count half a unit toward its expected value
+        diff: np.ndarray = exp - observed
+        shift: np.ndarray = np.sign(diff) * np.minimum(0.5, np.abs(diff))
+        obs = np.where((dof == 1)[:, None, None], observed + shift, observed)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if method == "pearson":
+            terms: np.ndarray = (obs - exp)**2 / exp
+        else:
+            terms = 2 * obs * np.log(obs / exp)
+    # empty cells add nothing to G
+    keep: np.ndarray = cells & (obs > 0) if method == "g" else cells
+    stat: np.ndarray = np.where(keep, terms, 0.0).sum(axis=(1, 2))
+    size: np.ndarray = np.maximum(used_rows * used_cols, 1)
+    exp_min: np.ndarray = np.where(cells, exp, np.inf).min(axis=(1, 2))
+    small: np.ndarray = (cells & (exp < min_expected)).sum(axis=(1, 2)) \
+        / size
+    return pd.DataFrame({
+        "stat": stat, "pval": stats.chi2.sf(stat, dof), "dof": dof,
+        "min_expected": exp_min, "small": small,
+        "valid": (exp_min >= 1) & (small <= 0.2)})
+
+
+def fisher(observed: np.ndarray,
+           alternative: str = "two-sided") -> pd.DataFrame:
+    """
+    Fisher's exact test of each 2 x 2 table, as
+    scipy.stats.fisher_exact; "larger" is the alternative that the odds
+    ratio is greater than 1. Each table's p-value sums the
+    hypergeometric probabilities over the counts its margins allow, so
+    it suits tables too small for independence().
+    :param observed: counts, of shape (2, 2) or (tables, 2, 2)
+    :return: a pd.DataFrame with columns odds_ratio (the sample odds
+    ratio) and pval, one row per table
+    """
+    if alternative not in ALTERNATIVES:
+        raise ValueError(f"alternative must be one of {ALTERNATIVES}")
+    observed = np.asarray(observed, dtype=np.int64)
+    if observed.shape[-2:] != (2, 2):
+        raise ValueError("fisher() tests 2 x 2 tables")
+    observed = observed.reshape(-1, 2, 2)
+    a, b = observed[:, 0, 0], observed[:, 0, 1]
+    c, d = observed[:, 1, 0], observed[:, 1, 1]
+    row, col, n = a + b, a + c, a + b + c + d
+    with np.errstate(divide="ignore", invalid="ignore"):
+        odds: np.ndarray = np.where(
+            (b * c == 0) & (a * d == 0), np.nan, a * d / (b * c))
+    dist = stats.hypergeom(n, row, col)
+    if alternative == "larger":
+        return pd.DataFrame({"odds_ratio": odds, "pval": dist.sf(a - 1)})
+    if alternative == "smaller":
+        return pd.DataFrame({"odds_ratio": odds, "pval": dist.cdf(a)})
+    lo: np.ndarray = np.maximum(0, row + col - n)
+    hi: np.ndarray = np.minimum(row, col)
+    # every count of the top-left cell, a row per table
+    k: np.ndarray = lo[:, None] + np.arange((hi - lo).max() + 1)[None, :]
+    pmf: np.ndarray = np.where(
+        k <= hi[:, None],
+        stats.hypergeom.pmf(k, n[:, None], row[:, None], col[:, None]), 0.0)
+    limit: np.ndarray = dist.pmf(a) * (1 + 1e-7)
+    pval: np.ndarray = np.where(pmf <= limit[:, None], pmf, 0.0).sum(axis=1)
+    return pd.DataFrame({"odds_ratio": odds, "pval": np.minimum(1.0, pval)})
+
+
+def results(table: pd.DataFrame) -> List[summarise.ContingencyTest]:
+    """
+    :return: a summarise.ContingencyTest for each row of an
+    independence table
+    """
+    return [
+        summarise.ContingencyTest(s, p, int(d))
+        for s, p, d in zip(table["stat"], table["pval"], table["dof"])]
@@ -0,0 +1,105 @@
+"""
+A module of statistics computed directly from frequency tables, i.e.
+(value, count) pairs, in time proportional to the number of distinct
+values rather than the number of observations.
+Results match those of the expanded sample, np.repeat(values, counts),
+without ever building it. An accumulate.Frequencies of numeric values
+gives such a table through its table() method.
+"""
+
+from typing import Tuple, Union
+
+import numpy as np
+
+from src import describe
+from src.accumulate import Moments
+
+
+def _table(values: np.ndarray,
+           counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: values and counts as float and int arrays, sorted by value,
+    without the values that were never observed
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    counts = np.asarray(counts).ravel()
+    if values.shape != counts.shape:
+        raise ValueError("values and counts must be the same length")
+    if (counts < 0).any():
+        raise ValueError("counts must be non-negative")
+    order: np.ndarray = np.argsort(values, kind="stable")
+    values, counts = values[order], counts[order].astype(np.int64)
+    keep: np.ndarray = counts > 0
+    return values[keep], counts[keep]
+
+
+def moments(values: np.ndarray, counts: np.ndarray,
+            label: str = "Sample") -> Moments:
+    """
+    :return: the Moments (size, mean, M2) of the expanded sample
+    """
+    values, counts = _table(values, counts)
+    size: int = int(counts.sum())
+    if not size:
+        return Moments(label)
+    mean: float = float(np.dot(values, counts) / size)
+    m2: float = float(np.dot((values - mean)**2, counts))
+    return Moments(label, size, mean, m2)
+
+
+def mean(values: np.ndarray, counts: np.ndarray) -> float:
+    """
+    :return: the mean of the expanded sample
+    """
+    return moments(values, counts).mean
+
+
+def var(values: np.ndarray, counts: np.ndarray, ddof: int = 1) -> float:
+    """
+    :return: the variance of the expanded sample
+    """
+    m: Moments = moments(values, counts)
+    return m.m2 / (m.size - ddof)
+
+
+def quantile(values: np.ndarray, counts: np.ndarray,
+             q: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+    """
+    :return: the q-th quantile(s) of the expanded sample, interpolated
+    linearly as np.quantile
+    """
+    values, counts = _table(values, counts)
+    q = np.asarray(q, dtype=np.float64)
+    if ((q < 0) | (q > 1)).any():
+        raise ValueError("quantiles must be in the range [0, 1]")
+    # the (0-based) position of the last copy of each value
+    last: np.ndarray = np.cumsum(counts) - 1
+    pos: np.ndarray = q * last[-1]
+    lo: np.ndarray = np.floor(pos)
+    below: np.ndarray = values[np.searchsorted(last, lo)]
+    above: np.ndarray = values[np.searchsorted(last, np.ceil(pos))]
+    res: np.ndarray = below + (pos - lo) * (above - below)
+    return float(res) if res.ndim == 0 else res
+
+
+def median(values: np.ndarray, counts: np.ndarray) -> float:
+    """
+    :return: the median of the expanded sample
+    """
+    return quantile(values, counts, 0.5)
+
+
+def tsample(values: np.ndarray, counts: np.ndarray, label: str = "Sample",
+            alpha: float = 0.05) -> describe.TSample:
+    """
+    :return: the expanded sample as a describe.TSample
+    """
+    return moments(values, counts, label).tsample(alpha)
+
+
+def zsample(values: np.ndarray, counts: np.ndarray, label: str = "Sample",
+            alpha: float = 0.05) -> describe.ZSample:
+    """
+    :return: the expanded sample as a describe.ZSample
+    """
+    return moments(values, counts, label).zsample(alpha)
@@ -0,0 +1,176 @@
+"""
+A module for chi-square goodness-of-fit tests of many count tables at
+once.
+Each row of observed counts is fitted to a distribution family, its
+parameters estimated from the counts, bins with small expected counts
+are collapsed into their neighbours, and the degrees of freedom are
+reduced by the number of bins and estimated parameters.
+Every step works across all tables together; only the collapsing scans
+the bins in order.
+"""
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from src import summarise
+
+FAMILIES: Tuple[str, ...] = ("poisson", "binomial", "geometric", "normal")
+
+
+def _estimate(family: str, values: np.ndarray, observed: np.ndarray,
+              trials: int) -> Dict[str, np.ndarray]:
+    """
+    :return: the parameters of family estimated from the counts of
+    values in each row of observed, as a dict of name -> array
+    """
+    total: np.ndarray = observed.sum(axis=1)
+    mean: np.ndarray = observed @ values / total
+    if family == "poisson":
+        return {"mu": mean}
+    if family == "binomial":
+        return {"p": mean / trials}
+    if family == "geometric":
+        return {"p": 1 / mean}
+    sq: np.ndarray = observed @ values**2 / total
+    # the sample standard deviation of the binned data (ddof=1)
+    sigma: np.ndarray = np.sqrt((sq - mean**2) * total / (total - 1))
+    return {"mu": mean, "sigma": sigma}
+
+
+def _probabilities(family: str, params: Dict[str, np.ndarray],
+                   values: np.ndarray, edges: np.ndarray, trials: int,
+                   open_tail: bool) -> np.ndarray:
+    """
+    :return: the probability of each bin under family for each table,
+    the last bin taking the whole upper tail if open_tail
+    """
+    if family == "normal":
+        mu: np.ndarray = params["mu"][:, None]
+        sigma: np.ndarray = params["sigma"][:, None]
+        cdf: np.ndarray = stats.norm.cdf((edges[None, :] - mu) / sigma)
+        cdf[:, 0], cdf[:, -1] = 0.0, 1.0
+        return np.diff(cdf, axis=1)
+    if family == "poisson":
+        dist = stats.poisson(params["mu"][:, None])
+    elif family == "binomial":
+        dist = stats.binom(trials, params["p"][:, None])
+    else:
+        dist = stats.geom(params["p"][:, None])
+    prob: np.ndarray = dist.pmf(values[None, :])
+    if open_tail:
+        prob[:, -1] = dist.sf(values[-1] - 1)[:, 0]
+    return prob
+
+
+def collapse(observed: np.ndarray, expected: np.ndarray,
+             min_expected: float = 5.0
+             ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merges adjacent bins, left to right, until each merged bin has an
+    expected count of at least min_expected; any remainder at the end
+    joins the last merged bin.
+    :return: the collapsed observed and expected counts, padded with
+    zeros to the width of the input, and the number of bins of each row
+    """
+    observed = np.atleast_2d(np.asarray(observed, dtype=np.float64))
+    expected = np.atleast_2d(np.asarray(expected, dtype=np.float64))
+    rows, k = expected.shape
+    group: np.ndarray = np.empty((rows, k), dtype=np.intp)
+    gid: np.ndarray = np.zeros(rows, dtype=np.intp)
+    acc: np.ndarray = np.zeros(rows)
+    for b in range(k):
+        group[:, b] = gid
+        acc += expected[:, b]
+        closed: np.ndarray = acc >= min_expected
+        gid += closed
+        acc[closed] = 0.0
+    # an unfinished last group joins the group before it
+    tail: np.ndarray = (group == gid[:, None]) & (gid > 0)[:, None]
+    group[tail] -= 1
+    bins: np.ndarray = np.maximum(gid, 1)
+    flat: np.ndarray = (group + np.arange(rows)[:, None] * k).ravel()
+    obs: np.ndarray = np.bincount(
+        flat, observed.ravel(), rows * k).reshape(rows, k)
+    exp: np.ndarray = np.bincount(
+        flat, expected.ravel(), rows * k).reshape(rows, k)
+    return obs, exp, bins
+
+
+def fit(observed: np.ndarray, family: str = "poisson",
+        values: np.ndarray = None, edges: np.ndarray = None,
+        trials: int = None, params: Dict[str, np.ndarray] = None,
+        min_expected: float = 5.0, open_tail: bool = True) -> pd.DataFrame:
+    """
+    Tests the fit of family to each row of observed counts.
+    :param observed: counts, one table per row, one bin per column
+    :param family: one of "poisson", "binomial", "geometric", "normal"
+    :param values: the value counted in each bin, 0, 1, ... by default
+    (1, 2, ... for "geometric"); for "normal" the bin midpoints, or
+    the inner edge of an outer bin with an infinite edge
+    :param edges: for "normal", the k + 1 bin edges; the outer bins
+    take the tails, and their outer edges may be -inf and inf
+    :param trials: for "binomial", the number of trials, the largest
+    value by default
+    :param params: known parameters, by name, for every table; if None
+    they are estimated and cost a degree of freedom each
+    :param open_tail: the last bin counts that value or more
+    :return: a pd.DataFrame with columns chisq, pval, dof and bins, and
+    one column per parameter, one row per table
+    """
+    if family not in FAMILIES:
+        raise ValueError(f"family must be one of {FAMILIES}")
+    observed = np.atleast_2d(np.asarray(observed, dtype=np.float64))
+    k: int = observed.shape[1]
+    if family == "normal":
+        if edges is None or len(edges) != k + 1:
+            raise ValueError("family 'normal' needs k + 1 bin edges")
+        edges = np.asarray(edges, dtype=np.float64)
+        if values is None:
+            with np.errstate(invalid="ignore"):
+                values = (edges[:-1] + edges[1:]) / 2
+            # an open tail bin is represented by its inner edge
+            values[0] = edges[1] if np.isinf(edges[0]) else values[0]
+            values[-1] = edges[-2] if np.isinf(edges[-1]) else values[-1]
+        if not np.isfinite(values).all():
+            raise ValueError("family 'normal' needs finite bin values")
+    elif values is None:
+        values = np.arange(k) + (family == "geometric")
+    values = np.asarray(values, dtype=np.float64)
+    if family == "binomial":
+        trials = int(values[-1]) if trials is None else trials
+        open_tail = False
+    if params is None:
+        params = _estimate(family, values, observed, trials)
+        ddof: int = len(params)
+    else:
+        params = {
+            name: np.broadcast_to(
+                np.asarray(p, dtype=np.float64), observed.shape[:1])
+            for name, p in params.items()}
+        ddof = 0
+    prob: np.ndarray = _probabilities(
+        family, params, values, edges, trials, open_tail)
+    expected: np.ndarray = prob * observed.sum(axis=1, keepdims=True)
+    obs, exp, bins = collapse(observed, expected, min_expected)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms: np.ndarray = np.where(exp > 0, (obs - exp)**2 / exp, 0.0)
+    chisq: np.ndarray = terms.sum(axis=1)
+    dof: np.ndarray = bins - 1 - ddof
+    res: pd.DataFrame = pd.DataFrame({
+        "chisq": chisq, "pval": stats.chi2.sf(chisq, dof), "dof": dof,
+        "bins": bins})
+    for name, p in params.items():
+        res[name] = p
+    return res
+
+
+def results(table: pd.DataFrame) -> List[summarise.ChisqGoodnessOfFit]:
+    """
+    :return: a summarise.ChisqGoodnessOfFit for each row of a fit table
+    """
+    return [
+        summarise.ChisqGoodnessOfFit(c, p, int(d))
+        for c, p, d in zip(table["chisq"], table["pval"], table["dof"])]
@@ -0,0 +1,199 @@
+"""
+A module for bulk loading csv files into the sqlite3 source database,
+so they can be served by load.Data like any other table.
+Files are streamed in batches, each inserted with executemany, into a
+staging table that replaces the target in one transaction at the end.
+"""
+
+import csv
+import sqlite3
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from src import load
+
+# formats tried, in order, when inferring date columns
+DAYFIRST: Tuple[str, ...] = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+MONTHFIRST: Tuple[str, ...] = ("%Y-%m-%d", "%m/%d/%Y", "%m-%d-%Y")
+
+
+def _is(convert: Callable[[str], Any], values: Sequence[str]) -> bool:
+    """
+    :return: True if convert accepts every value
+    """
+    try:
+        for value in values:
+            convert(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _date_format(values: Sequence[str], formats: Sequence[str]) -> str:
+    """
+    :return: the first of formats that parses every value, else None
+    """
+    for fmt in formats:
+        if _is(lambda v: datetime.strptime(v, fmt), values):
+            return fmt
+    return None
+
+
+def _converter(decl: str, fmt: str) -> Callable[[str], Any]:
+    """
+    :return: a function casting a csv field to a value of type decl.
+    Empty fields become NULL, and fields that do not fit decl are kept
+    as text, leaving sqlite's type affinity to store them.
+    """
+    def convert(value: str) -> Any:
+        if value == "":
+            return None
+        try:
+            if decl == "INTEGER":
+                try:
+                    return int(value)
+                except ValueError:
+                    return float(value)
+            if decl == "REAL":
+                return float(value)
+            if decl == "DATE":
+                return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            pass
+        return value
+    return convert
+
+
+class Ingest():
+    """
+    A class to model streaming csv files into an sqlite3 database.
+    """
+
+    BATCH_SIZE: int = 50_000
+    # rows read ahead to infer the type of each column
+    INFER_ROWS: int = 10_000
+
+    def infer(header: Sequence[str], rows: Sequence[Sequence[str]],
+              dayfirst: bool = True) -> List[Tuple[str, str, str]]:
+        """
+        :return: (name, declared type, date format) for each column,
+        the type being the narrowest of INTEGER, REAL, DATE and TEXT
+        that holds every non-empty value in rows
+        """
+        formats: Tuple[str, ...] = DAYFIRST if dayfirst else MONTHFIRST
+        schema: List[Tuple[str, str, str]] = list()
+        for i, name in enumerate(header):
+            values: List[str] = [
+                row[i] for row in rows if i < len(row) and row[i] != ""]
+            fmt: str = None
+            if not values:
+                decl: str = "TEXT"
+            elif _is(int, values):
+                decl = "INTEGER"
+            elif _is(float, values):
+                decl = "REAL"
+            else:
+                fmt = _date_format(values, formats)
+                decl = "TEXT" if fmt is None else "DATE"
+            schema.append((name, decl, fmt))
+        return schema
+
+    def csv(path: str, tbl: str = None, index: Sequence[str] = (),
+            dayfirst: bool = True, source: str = None) -> int:
+        """
+        Streams the csv file at path into tbl, replacing any existing
+        table of that name.
+        :param tbl: the table to load, the file's stem if None
+        :param index: columns to index, e.g. the grouping columns
+        :param dayfirst: read ambiguous dates as dd/mm/yyyy
+        :param source: the database, load.Data.SOURCE if None
+        :return: the number of rows loaded
+        """
+        tbl = tbl or Path(path).stem
+        source = source or load.Data.SOURCE
+        # utf-8-sig drops the byte order mark some exports start with
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader: Iterator[List[str]] = csv.reader(f)
+            header: List[str] = next(reader)
+            missing: List[str] = [col for col in index if col not in header]
+            if missing:
+                raise ValueError(f"cannot index missing columns {missing}")
+            head: List[List[str]] = list(islice(reader, Ingest.INFER_ROWS))
+            schema: List[Tuple[str, str, str]] = Ingest.infer(
+                header, head, dayfirst)
+            converters: List[Callable[[str], Any]] = [
+                _converter(decl, fmt) for _, decl, fmt in schema]
+            width: int = len(header)
+
+            def batches() -> Iterator[List[tuple]]:
+                rows: Iterator[List[str]] = (
+                    row for part in (head, reader) for row in part if row)
+                while True:
+                    batch: List[tuple] = [
+                        tuple(c(v) for c, v in zip(converters, row[:width]))
+                        + (None,) * (width - len(row))
+                        for row in islice(rows, Ingest.BATCH_SIZE)]
+                    if not batch:
+                        return
+                    yield batch
+
+            return Ingest._write(source, tbl, schema, batches(), index)
+
+    def folder(directory: str, index: Dict[str, Sequence[str]] = None,
+               dayfirst: bool = True, source: str = None) -> Dict[str, int]:
+        """
+        Streams every csv file in directory into a table named by its
+        stem.
+        :param index: a dict of table -> columns to index
+        :return: a dict of table -> number of rows loaded
+        """
+        index = index or dict()
+        return {
+            path.stem: Ingest.csv(
+                str(path), path.stem, index.get(path.stem, ()), dayfirst,
+                source)
+            for path in sorted(Path(directory).glob("*.csv"))}
+
+    def _write(source: str, tbl: str, schema: List[Tuple[str, str, str]],
+               batches: Iterator[List[tuple]], index: Sequence[str]) -> int:
+        """
+        inserts batches into a staging table, committing each batch,
+        then swaps it in for tbl and builds the indexes
+        :return: the number of rows inserted
+        """
+        q = load._quote
+        stage: str = q(tbl + "__ingest")
+        cols: str = ", ".join(f"{q(name)} {decl}" for name, decl, _ in schema)
+        insert: str = (
+            f"INSERT INTO {stage} VALUES "
+            f"({', '.join('?' * len(schema))})")
+        total: int = 0
+        # autocommit mode, so DDL runs inside the explicit transactions
+        conn: sqlite3.Connection = sqlite3.connect(
+            source, isolation_level=None)
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS {stage}")
+            conn.execute(f"CREATE TABLE {stage} ({cols})")
+            for batch in batches:
+                conn.execute("BEGIN")
+                conn.executemany(insert, batch)
+                conn.execute("COMMIT")
+                total += len(batch)
+            conn.execute("BEGIN")
+            conn.execute(f"DROP TABLE IF EXISTS {q(tbl)}")
+            conn.execute(f"ALTER TABLE {stage} RENAME TO {q(tbl)}")
+            for col in index:
+                conn.execute(
+                    f"CREATE INDEX {q(f'{tbl}_{col}_idx')} "
+                    f"ON {q(tbl)} ({q(col)})")
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            conn.execute(f"DROP TABLE IF EXISTS {stage}")
+            raise
+        finally:
+            conn.close()
+        return total
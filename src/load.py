@@ -1,40 +1,905 @@
-
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import queue
+import shutil
 import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Sequence,
+                    Tuple, Union)
+
+import numpy as np
 import pandas as pd
 
 
+class ConnectionPool():
+    """
+    A class to model a bounded pool of read-only connections to an
+    sqlite3 database.
+    Connections are opened lazily, up to size, and handed out to one
+    caller at a time, so concurrent callers never share a connection.
+    """
+
+    def __init__(self, source: str, size: int = 4,
+                 timeout: float = 30.0) -> None:
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.source: str = source
+        self.size: int = size
+        self.timeout: float = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue(maxsize=size)
+        self._opened: List[sqlite3.Connection] = list()
+        self._lock: threading.Lock = threading.Lock()
+        self._closed: bool = False
+
+    def __enter__(self) -> "ConnectionPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _open(self) -> sqlite3.Connection:
+        """
+        opens a new read-only connection to the source database
+        """
+        uri: str = Path(self.source).resolve().as_uri() + "?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def _checkout(self) -> sqlite3.Connection:
+        """
+        :return: an idle connection, opening a new one if the pool is
+        not yet full, else waiting up to timeout for one to be released
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("connection pool is closed")
+            if len(self._opened) < self.size:
+                conn: sqlite3.Connection = self._open()
+                self._opened.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"no connection released within {self.timeout}s") from None
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        :return: a context manager lending a connection from the pool,
+        returning it to the pool on exit
+        """
+        conn: sqlite3.Connection = self._checkout()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                closed: bool = self._closed
+            if closed:
+                conn.close()
+            else:
+                self._idle.put_nowait(conn)
+
+    def close(self) -> None:
+        """
+        closes every connection opened by the pool. Connections on loan
+        are closed when they are returned.
+        """
+        with self._lock:
+            self._closed = True
+            self._opened.clear()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class FrameCache():
+    """
+    A class to model an in-process LRU cache of query results, bounded
+    by an approximate memory budget in bytes.
+    Each entry is stored with the version of the source it was read
+    from, and is dropped when read back against a different version.
+    """
+
+    def __init__(self, budget: int) -> None:
+        self.budget: int = budget
+        self.used: int = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state: Dict[str, Any] = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, version: Any) -> Any:
+        """
+        :return: the value cached under key for version, else None
+        """
+        with self._lock:
+            entry: tuple = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                self._evict(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Any, version: Any, value: Any, nbytes: int) -> None:
+        """
+        caches value under key for version, dropping entries from other
+        versions and evicting the least recently used entries to stay
+        within budget. Values larger than the whole budget are not cached.
+        """
+        with self._lock:
+            stale: List[Any] = [
+                k for k, e in self._entries.items()
+                if k == key or e[0] != version]
+            for k in stale:
+                self._evict(k)
+            if nbytes > self.budget:
+                return
+            self._entries[key] = (version, value, nbytes)
+            self.used += nbytes
+            while self.used > self.budget:
+                self._evict(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        """
+        drops every entry
+        """
+        with self._lock:
+            self._entries.clear()
+            self.used = 0
+
+    def _evict(self, key: Any) -> None:
+        self.used -= self._entries.pop(key)[2]
+
+
+def _version(source: str) -> Tuple[int, ...]:
+    """
+    :return: a token that changes whenever the database file, or its
+    write-ahead log, is written to
+    """
+    token: List[int] = list()
+    for path in (Path(source), Path(str(source) + "-wal")):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        token.extend((stat.st_mtime_ns, stat.st_size))
+    return tuple(token)
+
+
+class ColumnStore():
+    """
+    A class to model a persistent columnar copy of the tables in an
+    sqlite3 database, one .npy file per column.
+    Columns are kept under a directory named by a content fingerprint
+    of the database. manifest.json records the fingerprint, the version
+    of the source file it was taken from, the settings the columns were
+    typed with and, per table, how to rebuild each column; labels are
+    held as integer codes plus their categories.
+    """
+
+    MANIFEST: str = "manifest.json"
+
+    def __init__(self, root: str, source: str, settings: str = "") -> None:
+        self.root: Path = Path(root)
+        self.source: str = source
+        self.settings: str = settings
+
+    def fingerprint(self) -> str:
+        """
+        :return: the sha256 digest of the source database file
+        """
+        digest = hashlib.sha256()
+        with open(self.source, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def manifest(self) -> Dict[str, Any]:
+        """
+        :return: the current manifest, empty if there is none
+        """
+        try:
+            with open(self.root / ColumnStore.MANIFEST) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def is_fresh(self, manifest: Dict[str, Any] = None) -> bool:
+        """
+        :return: True if the store was built from the source as it is
+        now, with the same settings
+        """
+        manifest = self.manifest() if manifest is None else manifest
+        return (bool(manifest)
+                and manifest.get("version") == list(_version(self.source))
+                and manifest.get("settings") == self.settings)
+
+    def path(self, tbl: str, col: str,
+             manifest: Dict[str, Any] = None) -> Path:
+        """
+        :return: the .npy file holding col of tbl
+        """
+        manifest = self.manifest() if manifest is None else manifest
+        meta: Dict[str, Any] = manifest["tables"][tbl]
+        names: List[str] = [c["name"] for c in meta["columns"]]
+        return (self.root / manifest["fingerprint"] / meta["dir"]
+                / f"{names.index(col)}.npy")
+
+    def read(self, tbl: str,
+             columns: Sequence[str] = None) -> Union[pd.DataFrame, None]:
+        """
+        :return: columns of tbl as a pd.DataFrame, or None if the store
+        is stale or does not hold them
+        """
+        manifest: Dict[str, Any] = self.manifest()
+        if not self.is_fresh(manifest) or tbl not in manifest["tables"]:
+            return None
+        meta: Dict[str, Any] = manifest["tables"][tbl]
+        names: List[str] = [c["name"] for c in meta["columns"]]
+        if columns and not set(columns) <= set(names):
+            return None
+        folder: Path = self.root / manifest["fingerprint"] / meta["dir"]
+        data: Dict[str, Any] = dict()
+        try:
+            for i, col in enumerate(meta["columns"]):
+                if columns and col["name"] not in columns:
+                    continue
+                arr: np.ndarray = np.load(folder / f"{i}.npy")
+                data[col["name"]] = ColumnStore._decode(arr, col)
+        except OSError:
+            # the store was rebuilt under us
+            return None
+        return pd.DataFrame(data, columns=list(columns or names))
+
+    def memmap(self, tbl: str, col: str) -> np.ndarray:
+        """
+        :return: numeric col of tbl as a read-only np.memmap, so every
+        process that maps it shares the same pages
+        """
+        manifest: Dict[str, Any] = self.manifest()
+        if not self.is_fresh(manifest):
+            raise RuntimeError(
+                f"column store {self.root} is stale or missing, "
+                "run Data.refresh_store()")
+        if tbl not in manifest["tables"]:
+            raise LookupError(f"no table {tbl} in column store")
+        meta: List[Dict[str, Any]] = manifest["tables"][tbl]["columns"]
+        kinds: Dict[str, str] = {c["name"]: c["kind"] for c in meta}
+        if col not in kinds:
+            raise LookupError(f"no column {col} in table {tbl}")
+        if kinds[col] != "array":
+            raise TypeError(f"{tbl}.{col} is not numeric")
+        return np.load(self.path(tbl, col, manifest), mmap_mode="r")
+
+    def write(self, tables: Iterable[Tuple[str, pd.DataFrame]],
+              fingerprint: str, version: Tuple[int, ...]) -> None:
+        """
+        writes each (name, frame) of tables under fingerprint as it
+        arrives, so a generator of tables is held one at a time, then
+        swaps in the new manifest and removes the columns of any earlier
+        fingerprint
+        """
+        folder: Path = self.root / fingerprint
+        shutil.rmtree(folder, ignore_errors=True)
+        metas: Dict[str, Any] = dict()
+        for i, (tbl, df) in enumerate(tables):
+            (folder / str(i)).mkdir(parents=True)
+            cols: List[Dict[str, Any]] = list()
+            for j, name in enumerate(df.columns):
+                arr, col = ColumnStore._encode(df[name])
+                np.save(folder / str(i) / f"{j}.npy", arr, allow_pickle=False)
+                cols.append(dict(name=name, **col))
+            metas[tbl] = dict(dir=str(i), columns=cols)
+        self._swap(dict(
+            fingerprint=fingerprint, version=list(version),
+            settings=self.settings, tables=metas))
+
+    def touch(self, version: Tuple[int, ...]) -> None:
+        """
+        marks the store as built from the source at version, for when
+        the file changed on disk but its content did not
+        """
+        manifest: Dict[str, Any] = self.manifest()
+        manifest["version"] = list(version)
+        self._swap(manifest)
+
+    def _swap(self, manifest: Dict[str, Any]) -> None:
+        tmp: Path = self.root / (ColumnStore.MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.root / ColumnStore.MANIFEST)
+        for old in self.root.iterdir():
+            if old.is_dir() and old.name != manifest["fingerprint"]:
+                shutil.rmtree(old, ignore_errors=True)
+
+    def _encode(col: pd.Series) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        :return: col as a plain ndarray, and what is needed to decode it
+        """
+        dtype: str = str(col.dtype)
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            cat: pd.Categorical = col.array
+            return cat.codes, dict(
+                kind="category", dtype=dtype,
+                categories=cat.categories.tolist())
+        if (pd.api.types.is_numeric_dtype(col)
+                or pd.api.types.is_bool_dtype(col)
+                or pd.api.types.is_datetime64_dtype(col)):
+            return col.to_numpy(), dict(kind="array", dtype=dtype)
+        codes, uniques = pd.factorize(col)
+        return codes.astype(np.int32), dict(
+            kind="labels", dtype=dtype, categories=list(uniques))
+
+    def _decode(arr: np.ndarray, col: Dict[str, Any]) -> Any:
+        """
+        :return: the column encoded as arr by ColumnStore._encode
+        """
+        if col["kind"] == "array":
+            return arr
+        if col["kind"] == "category":
+            return pd.Categorical.from_codes(arr, col["categories"])
+        labels: np.ndarray = np.empty(len(col["categories"]) + 1, object)
+        labels[:-1] = col["categories"]
+        labels[-1] = None
+        return pd.Series(labels[arr]).astype(col["dtype"])
+
+
+# SQL templates of the statistics Data.aggregate computes per group
+AGGREGATES: Dict[str, str] = {
+    "count": "COUNT({0})",
+    "sum": "TOTAL({0})",
+    "sumsq": "TOTAL({0} * {0})",
+    "min": "MIN({0})",
+    "max": "MAX({0})",
+}
+
+
+def _quote(name: str) -> str:
+    """
+    :return: name quoted as an sqlite identifier
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _where(where: Union[str, Dict[str, Any], None],
+           params: Sequence[Any]) -> Tuple[str, List[Any]]:
+    """
+    :return: a WHERE clause and its parameters.
+    A str is used verbatim with params bound to its placeholders.
+    A dict maps columns to a value (=), or a list/tuple/set of values
+    (IN), and is always fully parameterised.
+    """
+    if where is None:
+        return "", list(params)
+    if isinstance(where, str):
+        return " WHERE " + where, list(params)
+    terms: List[str] = list()
+    args: List[Any] = list()
+    for col, val in where.items():
+        if isinstance(val, (list, tuple, set, frozenset)):
+            val = list(val)
+            terms.append(
+                f"{_quote(col)} IN ({', '.join('?' * len(val))})")
+            args.extend(val)
+        elif val is None:
+            terms.append(f"{_quote(col)} IS NULL")
+        else:
+            terms.append(f"{_quote(col)} = ?")
+            args.append(val)
+    return " WHERE " + " AND ".join(terms), args + list(params)
+
+
+def _select(tbl: str, columns: Sequence[str] = None,
+            where: Union[str, Dict[str, Any]] = None,
+            params: Sequence[Any] = ()) -> Tuple[str, List[Any]]:
+    """
+    :return: a parameterised SELECT statement on tbl and its parameters
+    """
+    cols: str = "*" if not columns else ", ".join(map(_quote, columns))
+    clause, args = _where(where, params)
+    return f"SELECT {cols} from {_quote(tbl)}{clause}", args
+
+
+def _affinity(decl: str) -> str:
+    """
+    :return: the type affinity sqlite gives a column declared as decl
+    """
+    decl = decl.upper()
+    if "INT" in decl:
+        return "INTEGER"
+    if any(t in decl for t in ("CHAR", "CLOB", "TEXT")):
+        return "TEXT"
+    if "BLOB" in decl or not decl:
+        return "BLOB"
+    if any(t in decl for t in ("REAL", "FLOA", "DOUB")):
+        return "REAL"
+    return "NUMERIC"
+
+
+def _infer(col: pd.Series, max_ratio: float, numeric: bool = True) -> Any:
+    """
+    :param numeric: parse text that is all numbers as numbers, else
+    keep it as labels
+    :return: the dtype Data.get gives col: int64 for integral values,
+    float64 for other numbers, category for labels with at most
+    max_ratio * size distinct values, else the current dtype
+    """
+    values: pd.Series = col
+    if not pd.api.types.is_numeric_dtype(col):
+        values = pd.to_numeric(col, errors="coerce") if numeric \
+            else pd.Series(np.nan, index=col.index)
+        if values.isna().sum() != col.isna().sum():
+            distinct: int = col.nunique(dropna=True)
+            if col.size and distinct <= max_ratio * col.size:
+                return "category"
+            return col.dtype
+    if pd.api.types.is_bool_dtype(values):
+        return bool
+    if values.isna().any():
+        return np.float64
+    if (pd.api.types.is_integer_dtype(values)
+            or (values.size and (values % 1 == 0).all())):
+        # narrower ints overflow silently in arithmetic, so they are
+        # only used when a schema asks for them
+        return np.int64
+    return np.float64
+
+
+def _coerce(df: pd.DataFrame, schema: Dict[str, Any],
+            infer: bool, max_ratio: float,
+            text: Sequence[str] = ()) -> pd.DataFrame:
+    """
+    :param text: columns declared as text, which inference keeps as
+    labels even if every value is a number, e.g. "0012"
+    :return: df with each column cast to its dtype in schema, or to an
+    inferred dtype if absent from schema and infer is True
+    """
+    for name in df.columns:
+        if name in schema:
+            dtype: Any = schema[name]
+        elif infer:
+            dtype = _infer(df[name], max_ratio, name not in text)
+        else:
+            continue
+        col: pd.Series = df[name]
+        if (not pd.api.types.is_numeric_dtype(col)
+                and dtype not in ("category", "string", object, str)
+                and pd.api.types.is_numeric_dtype(pd.Series(dtype=dtype))):
+            col = pd.to_numeric(col)
+        df[name] = col.astype(dtype)
+    return df
+
+
 class Data():
     """
     A class to model querying and returning tables from an sqlite3
     database.
+    Queries are served from a process-wide ConnectionPool, opened on
+    first use and closed with Data.close().
     """
 
     # relative path from scripts -> data
     SOURCE: str = "..\\data\\source.db3"
-    conn: sqlite3.Connection = None
+    CHUNK_SIZE: int = 100_000
+    # declared dtypes per table, e.g. {"skulls": {"size": "int16"}},
+    # used ahead of inference
+    SCHEMAS: Dict[str, Dict[str, Any]] = dict()
+    # labels with at most this share of distinct values become category
+    CATEGORY_RATIO: float = 0.5
+    # memory budget for cached query results
+    CACHE_BYTES: int = 256 * 2**20
+    # relative path from scripts -> columnar copy of SOURCE
+    STORE: str = "..\\data\\columns"
+    POOL_SIZE: int = 4
+    TIMEOUT: float = 30.0
+    _pool: ConnectionPool = None
+    _cache: FrameCache = None
+    _declared_types: Dict[tuple, Dict[str, str]] = dict()
+    _lock: threading.Lock = threading.Lock()
 
-    def _create_connection() -> None:
+    def pool() -> ConnectionPool:
         """
-        create a database connection to the SQLite database
-        specified by the db_file
+        :return: the shared connection pool, creating it if needed, or
+        replacing it if Data.SOURCE has changed
         """
-        try:
-            Data.conn = sqlite3.connect(Data.SOURCE)
-        except sqlite3.Error as e:
-            print(e)
+        with Data._lock:
+            if Data._pool is not None and Data._pool.source != Data.SOURCE:
+                Data._pool.close()
+                Data._pool = None
+            if Data._pool is None or Data._pool._closed:
+                Data._pool = ConnectionPool(
+                    Data.SOURCE, Data.POOL_SIZE, Data.TIMEOUT)
+            return Data._pool
+
+    def close() -> None:
+        """
+        closes the shared connection pool
+        """
+        with Data._lock:
+            if Data._pool is not None:
+                Data._pool.close()
+                Data._pool = None
+
+    def cache() -> FrameCache:
+        """
+        :return: the shared result cache, creating it if needed
+        """
+        with Data._lock:
+            if Data._cache is None:
+                Data._cache = FrameCache(Data.CACHE_BYTES)
+            Data._cache.budget = Data.CACHE_BYTES
+            return Data._cache
+
+    def clear_cache() -> None:
+        """
+        empties the shared result cache
+        """
+        Data.cache().clear()
+
+    def store() -> ColumnStore:
+        """
+        :return: the columnar store of Data.SOURCE, typed with the
+        current Data.SCHEMAS and Data.CATEGORY_RATIO
+        """
+        return ColumnStore(Data.STORE, Data.SOURCE, Data._settings())
+
+    def _settings() -> str:
+        """
+        :return: the settings that inferred dtypes depend on, so a store
+        built under others is treated as stale
+        """
+        schemas: List[tuple] = sorted(
+            (tbl, sorted((k, str(v)) for k, v in schema.items()))
+            for tbl, schema in Data.SCHEMAS.items())
+        return repr((schemas, Data.CATEGORY_RATIO))
+
+    def column(tbl: str, col: str) -> np.ndarray:
+        """
+        :return: numeric col of tbl as a read-only np.memmap over the
+        columnar store, shared between processes without copying
+        """
+        return Data.store().memmap(tbl, col)
+
+    def tables() -> List[str]:
+        """
+        :return: the names of the tables in the source database
+        """
+        with Data.connect() as conn:
+            rows: List[tuple] = conn.execute(
+                "SELECT name from sqlite_master WHERE type = 'table' "
+                "AND name NOT LIKE 'sqlite_%' ORDER BY name").fetchall()
+        return [row[0] for row in rows]
+
+    def refresh_store(force: bool = False) -> bool:
+        """
+        (re)builds the columnar store of every table, with the dtypes
+        Data.get would infer, unless it already holds the content of
+        the source database typed with the current Data.SCHEMAS and
+        Data.CATEGORY_RATIO.
+        :return: True if the columns were rewritten
+        """
+        store: ColumnStore = Data.store()
+        version: Tuple[int, ...] = _version(Data.SOURCE)
+        fingerprint: str = store.fingerprint()
+        manifest: Dict[str, Any] = store.manifest()
+        if (not force and manifest.get("fingerprint") == fingerprint
+                and manifest.get("settings") == store.settings):
+            if manifest.get("version") != list(version):
+                store.touch(version)
+            return False
+        # read each table only as it is written
+        tables: Iterator[Tuple[str, pd.DataFrame]] = (
+            (tbl, Data._read(tbl, _select(tbl)[0], [], "infer"))
+            for tbl in Data.tables())
+        store.write(tables, fingerprint, version)
+        return True
 
-    def _close_connecion() -> None:
+    @contextmanager
+    def connect() -> Iterator[sqlite3.Connection]:
         """
-        closes the active connection
+        :return: a context manager lending a pooled connection
         """
-        if Data.conn is not None:
-            Data.conn.close()
+        with Data.pool().connection() as conn:
+            yield conn
 
-    def get(tbl: str) -> pd.DataFrame:
+    def get(tbl: str, columns: Sequence[str] = None,
+            where: Union[str, Dict[str, Any]] = None,
+            params: Sequence[Any] = (),
+            dtypes: Union[Dict[str, Any], str, None] = "infer",
+            cache: bool = True) -> pd.DataFrame:
         """
+        :param columns: the columns to return, all if None
+        :param where: rows to return, as an SQL expression with ?
+        placeholders bound to params, or a dict of column -> value(s),
+        e.g. {"type": "Etruscan"} or {"season": [1718, 1819]}
+        :param dtypes: "infer" to use Data.SCHEMAS[tbl] and infer
+        dtypes for the remaining columns, e.g. category for labels, a
+        dict of column -> dtype to use ahead of both, or None to keep
+        sqlite's types
+        :param cache: serve from, and store in, Data.cache(). Entries
+        are invalidated when the source file changes on disk.
         :return: tbl from the source database as a pd.DataFrame
         """
-        Data._create_connection()
-        df: pd.DataFrame = pd.read_sql_query("SELECT * from " + tbl, Data.conn)
-        Data._close_connecion()
-        return df
+        sql, args = _select(tbl, columns, where, params)
+        key: tuple = (
+            sql, tuple(args), repr(dtypes),
+            repr(sorted(Data.SCHEMAS.get(tbl, dict()).items())),
+            Data.CATEGORY_RATIO)
+        return Data._cached(key, cache, functools.partial(
+            Data._load, tbl, columns, where, sql, args, dtypes))
+
+    def aggregate(tbl: str, by: Union[str, Sequence[str]],
+                  values: Union[Sequence[str], Dict[str, str]],
+                  stats: Sequence[str] = ("count", "sum", "sumsq"),
+                  where: Union[str, Dict[str, Any]] = None,
+                  params: Sequence[Any] = (), index: bool = False,
+                  cache: bool = True) -> pd.DataFrame:
+        """
+        Computes grouped sufficient statistics inside sqlite, so only
+        one row per group leaves the database.
+        :param by: the column(s) to group by
+        :param values: the columns to summarise, or a dict of name ->
+        SQL expression, e.g. {"homewin": "homegoals > awaygoals"}
+        :param stats: any of "count", "sum", "sumsq", "min", "max"
+        :param where: rows to include, as Data.get
+        :param index: create a covering index on by + values columns
+        first, see Data.index
+        :return: a pd.DataFrame with the by columns, n (rows per group)
+        and a <value>_<stat> column for each value and stat
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        if not isinstance(values, dict):
+            if index:
+                Data.index(tbl, by + [v for v in values if v not in by])
+            values = {v: _quote(v) for v in values}
+        elif index:
+            Data.index(tbl, by)
+        unknown: set = set(stats) - set(AGGREGATES)
+        if unknown:
+            raise ValueError(f"unknown stats {sorted(unknown)}")
+        terms: List[str] = [_quote(col) for col in by] + ["COUNT(*) AS n"]
+        for name, expr in values.items():
+            for stat in stats:
+                terms.append(
+                    AGGREGATES[stat].format(f"({expr})")
+                    + " AS " + _quote(f"{name}_{stat}"))
+        keys: str = ", ".join(map(_quote, by))
+        clause, args = _where(where, params)
+        sql: str = (
+            f"SELECT {', '.join(terms)} from {_quote(tbl)}{clause} "
+            f"GROUP BY {keys} ORDER BY {keys}")
+
+        def run() -> pd.DataFrame:
+            with Data.connect() as conn:
+                return pd.read_sql_query(sql, conn, params=args)
+
+        return Data._cached((sql, tuple(args)), cache, run)
+
+    def index(tbl: str, columns: Sequence[str]) -> str:
+        """
+        creates, if it does not exist, an index on columns of tbl,
+        through a short-lived writable connection since the pool is
+        read-only. Listing the grouping columns first, then the
+        summarised columns, lets sqlite aggregate from the index alone.
+        :return: the name of the index
+        """
+        name: str = f"{tbl}_{'_'.join(columns)}_idx"
+        conn: sqlite3.Connection = sqlite3.connect(Data.SOURCE)
+        try:
+            with conn:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_quote(name)} "
+                    f"ON {_quote(tbl)} ({', '.join(map(_quote, columns))})")
+        finally:
+            conn.close()
+        return name
+
+    def _cached(key: tuple, cache: bool,
+                load: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        :return: the frame cached under key for the current version of
+        the source, calling load and caching its result on a miss
+        """
+        if not cache:
+            return load()
+        key = (Data.SOURCE,) + key
+        version: Tuple[int, ...] = _version(Data.SOURCE)
+        store: FrameCache = Data.cache()
+        df: pd.DataFrame = store.get(key, version)
+        if df is None:
+            df = load()
+            store.put(key, version, df, int(df.memory_usage(deep=True).sum()))
+        # callers may modify their frame, so never hand out the cached one
+        return df.copy()
+
+    def get_many(queries: Union[Sequence[str], Dict[str, Dict[str, Any]]],
+                 snapshot: bool = True) -> Dict[str, pd.DataFrame]:
+        """
+        Loads several tables or queries in one call.
+        :param queries: table names, or a dict of name -> keyword
+        arguments of Data.get, e.g. {"etr": {"tbl": "skulls",
+        "where": {"type": "Etruscan"}}}
+        :param snapshot: if True, every query is read on one connection
+        inside one read transaction, so all results come from the same
+        state of the database, bypassing the cache and the columnar
+        store. If False, queries fan out over Data.POOL_SIZE threads
+        through Data.get.
+        :return: a dict of name -> pd.DataFrame
+        """
+        if not isinstance(queries, dict):
+            queries = {tbl: dict(tbl=tbl) for tbl in queries}
+        if not snapshot:
+            with ThreadPoolExecutor(Data.POOL_SIZE) as ex:
+                futures: Dict[str, Any] = {
+                    name: ex.submit(functools.partial(Data.get, **kwargs))
+                    for name, kwargs in queries.items()}
+                return {name: f.result() for name, f in futures.items()}
+        frames: Dict[str, pd.DataFrame] = dict()
+        with Data.connect() as conn:
+            conn.execute("BEGIN")
+            try:
+                for name, kwargs in queries.items():
+                    sql, args = _select(
+                        kwargs["tbl"], kwargs.get("columns"),
+                        kwargs.get("where"), kwargs.get("params", ()))
+                    frames[name] = pd.read_sql_query(sql, conn, params=args)
+            finally:
+                conn.rollback()
+        return {
+            name: Data._typed(
+                kwargs["tbl"], frames[name], kwargs.get("dtypes", "infer"),
+                True)
+            for name, kwargs in queries.items()}
+
+    async def aget_many(
+            queries: Union[Sequence[str], Dict[str, Dict[str, Any]]],
+            snapshot: bool = True) -> Dict[str, pd.DataFrame]:
+        """
+        Data.get_many, run in the event loop's executor so awaiting it
+        does not block the loop.
+        :return: a dict of name -> pd.DataFrame
+        """
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(Data.get_many, queries, snapshot))
+
+    def _load(tbl: str, columns: Sequence[str],
+              where: Union[str, Dict[str, Any]], sql: str, args: List[Any],
+              dtypes: Union[Dict[str, Any], str, None]) -> pd.DataFrame:
+        """
+        :return: the rows requested of Data.get, from the columnar store
+        when it is fresh and holds them, else from sqlite
+        """
+        if where is None and dtypes is not None:
+            df: pd.DataFrame = Data.store().read(tbl, columns)
+            if df is not None:
+                return Data._typed(tbl, df, dtypes, False)
+        return Data._read(tbl, sql, args, dtypes)
+
+    def _read(tbl: str, sql: str, args: List[Any],
+              dtypes: Union[Dict[str, Any], str, None]) -> pd.DataFrame:
+        """
+        :return: the result of sql as a pd.DataFrame, typed as Data.get
+        """
+        with Data.connect() as conn:
+            df: pd.DataFrame = pd.read_sql_query(sql, conn, params=args)
+        return Data._typed(tbl, df, dtypes, True)
+
+    def _typed(tbl: str, df: pd.DataFrame,
+               dtypes: Union[Dict[str, Any], str, None],
+               infer: bool) -> pd.DataFrame:
+        """
+        :return: df cast to the dtypes requested as in Data.get,
+        inferring undeclared columns if infer or dtypes is "infer"
+        """
+        if dtypes is None:
+            return df
+        declared: Dict[str, str] = Data._declared(tbl)
+        schema: Dict[str, Any] = {
+            name: "datetime64[ns]" for name, decl in declared.items()
+            if decl.upper() in ("DATE", "DATETIME", "TIMESTAMP")}
+        schema.update(Data.SCHEMAS.get(tbl, dict()))
+        if isinstance(dtypes, dict):
+            schema.update(dtypes)
+        # only columns with no declared type or a numeric affinity may
+        # hold numbers stored as text
+        text: List[str] = [
+            name for name, decl in declared.items()
+            if decl and _affinity(decl) in ("TEXT", "BLOB")]
+        return _coerce(
+            df, schema, infer or dtypes == "infer", Data.CATEGORY_RATIO,
+            text)
+
+    def _declared(tbl: str) -> Dict[str, str]:
+        """
+        :return: the declared type of each column of tbl, "" if none.
+        sqlite cannot hold dates, so DATE, DATETIME and TIMESTAMP
+        columns stored as ISO-8601 text become datetime64.
+        """
+        key: tuple = (Data.SOURCE, tbl, _version(Data.SOURCE))
+        if key not in Data._declared_types:
+            with Data.connect() as conn:
+                rows: List[tuple] = conn.execute(
+                    f"PRAGMA table_info({_quote(tbl)})").fetchall()
+            Data._declared_types[key] = {row[1]: row[2] for row in rows}
+        return dict(Data._declared_types[key])
+
+    def chunks(tbl: str, columns: Sequence[str] = None,
+               where: Union[str, Dict[str, Any]] = None,
+               params: Sequence[Any] = (),
+               size: int = None,
+               dtypes: Union[Dict[str, Any], str, None] = None
+               ) -> Iterator[pd.DataFrame]:
+        """
+        Streams tbl through a cursor, holding at most size rows in
+        memory at once. Arguments are as Data.get, but dtypes are only
+        applied when asked for: a dict casts just its columns, and
+        "infer" works chunk by chunk, so chunks may disagree.
+        :return: an iterator of pd.DataFrame of up to size rows
+        """
+        if dtypes is not None:
+            # look up declared types before _fetch holds a connection
+            Data._declared(tbl)
+        for names, rows in Data._fetch(tbl, columns, where, params, size):
+            df: pd.DataFrame = pd.DataFrame.from_records(rows, columns=names)
+            yield Data._typed(tbl, df, dtypes, False)
+
+    def blocks(tbl: str, columns: Sequence[str] = None,
+               where: Union[str, Dict[str, Any]] = None,
+               params: Sequence[Any] = (),
+               size: int = None) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Streams tbl through a cursor as column blocks, holding at most
+        size rows in memory at once. Arguments are as Data.get.
+        :return: an iterator of dicts of column name -> np.ndarray
+        """
+        for names, rows in Data._fetch(tbl, columns, where, params, size):
+            cols: Tuple[tuple] = tuple(zip(*rows))
+            yield {name: np.asarray(col) for name, col in zip(names, cols)}
+
+    def _fetch(tbl: str, columns: Sequence[str],
+               where: Union[str, Dict[str, Any]], params: Sequence[Any],
+               size: int) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """
+        :return: an iterator of (column names, rows) in batches of size
+        """
+        size = size or Data.CHUNK_SIZE
+        sql, args = _select(tbl, columns, where, params)
+        with Data.connect() as conn:
+            cur: sqlite3.Cursor = conn.execute(sql, args)
+            try:
+                names: List[str] = [d[0] for d in cur.description]
+                while True:
+                    rows: List[tuple] = cur.fetchmany(size)
+                    if not rows:
+                        break
+                    yield names, rows
+            finally:
+                cur.close()
@@ -0,0 +1,71 @@
+"""
+A module of corrections for multiple testing, for the columnar result
+tables of the batched tests, e.g. proportion.one_sample,
+contingency.independence or rank.wilcoxon.
+Each correction sorts the p-values once and adjusts them with running
+maxima or minima, in O(n log n) time with no Python loop, matching
+statsmodels.stats.multitest.multipletests.
+"""
+
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+METHODS: Tuple[str, ...] = ("bonferroni", "holm", "fdr_bh", "fdr_by")
+
+
+def adjust(pvals: np.ndarray, method: str = "holm") -> np.ndarray:
+    """
+    :param method: "bonferroni", "holm" (family-wise error rate),
+    "fdr_bh" (Benjamini-Hochberg) or "fdr_by" (Benjamini-Yekutieli,
+    false discovery rate under any dependence)
+    :return: the adjusted p-values, NaN where pvals is NaN, which do
+    not count as tests
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}")
+    pvals = np.asarray(pvals, dtype=np.float64)
+    res: np.ndarray = np.full(pvals.shape, np.nan)
+    tested: np.ndarray = ~np.isnan(pvals)
+    p: np.ndarray = pvals[tested]
+    m: int = p.size
+    if method == "bonferroni":
+        res[tested] = np.minimum(1.0, p * m)
+        return res
+    # tied p-values end up with equal adjustments, so any sort will do
+    order: np.ndarray = np.argsort(p)
+    ranked: np.ndarray = p[order]
+    rank: np.ndarray = np.arange(1, m + 1)
+    if method == "holm":
+        adj: np.ndarray = np.maximum.accumulate((m - rank + 1) * ranked)
+    else:
+        adj = np.minimum.accumulate((ranked * m / rank)[::-1])[::-1]
+        if method == "fdr_by":
+            adj *= np.sum(1.0 / rank)
+    out: np.ndarray = np.empty(m)
+    out[order] = np.minimum(1.0, adj)
+    res[tested] = out
+    return res
+
+
+def multipletests(pvals: np.ndarray, alpha: float = 0.05,
+                  method: str = "holm") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the reject flags at level alpha, and the adjusted p-values
+    """
+    adj: np.ndarray = adjust(pvals, method)
+    return adj <= alpha, adj
+
+
+def correct(table: pd.DataFrame, alpha: float = 0.05,
+            method: str = "holm", column: str = "pval") -> pd.DataFrame:
+    """
+    Corrects the p-values of every row of a result table together.
+    :param column: the column of p-values
+    :return: a copy of table with columns pval_adj, the adjusted
+    p-values, and reject, True where the adjusted p-value is at most
+    alpha
+    """
+    reject, adj = multipletests(table[column].to_numpy(), alpha, method)
+    return table.assign(pval_adj=adj, reject=reject)
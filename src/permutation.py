@@ -0,0 +1,182 @@
+"""
+A module of permutation tests for the difference in means of two
+independent samples, and of the mean difference of paired samples.
+Small designs are enumerated exactly. Larger ones are sampled in
+vectorised blocks of permutations, spread over a process pool with an
+independent seeded random stream per task, and stopped early once the
+p-value is clearly on one side of alpha.
+"""
+
+from concurrent.futures import Executor
+from itertools import combinations, product
+from math import comb
+from typing import Tuple
+
+import numpy as np
+
+from src import summarise, util
+from src.proportion import ALTERNATIVES
+
+# designs with at most this many distinct permutations are enumerated
+EXACT_MAX: int = 200_000
+
+
+def _stats(x: np.ndarray, n1: int, rng: np.random.Generator,
+           size: int) -> np.ndarray:
+    """
+    :return: size statistics of randomly permuted x; the difference in
+    means of the first n1 and the rest, or, if n1 is 0, the mean of x
+    with random signs
+    """
+    n: int = x.size
+    if n1 == 0:
+        signs: np.ndarray = rng.integers(0, 2, (size, n), dtype=np.int8)
+        return (x.sum() - 2 * (signs @ x)) / n
+    pick: np.ndarray = np.argpartition(
+        rng.random((size, n)), n1 - 1, axis=1)[:, :n1]
+    s1: np.ndarray = x[pick].sum(axis=1)
+    return s1 / n1 - (x.sum() - s1) / (n - n1)
+
+
+def _extreme(stats: np.ndarray, observed: float, alternative: str) -> int:
+    """
+    :return: how many of stats are at least as extreme as observed
+    """
+    # allow for rounding when equal statistics are computed differently
+    tol: float = 1e-9 * max(1.0, abs(observed))
+    if alternative == "two-sided":
+        return int(np.count_nonzero(np.abs(stats) >= abs(observed) - tol))
+    if alternative == "larger":
+        return int(np.count_nonzero(stats >= observed - tol))
+    return int(np.count_nonzero(stats <= observed + tol))
+
+
+def _count(data: Tuple[np.ndarray, int], seed: np.random.SeedSequence,
+           size: int, observed: float, alternative: str) -> int:
+    """
+    :param data: the sample x and n1
+    :return: how many of size random permutations of x give a
+    statistic at least as extreme as observed
+    """
+    x, n1 = data
+    rng: np.random.Generator = np.random.default_rng(seed)
+    block: int = max(1, util.BLOCK_CELLS // x.size)
+    hits: int = 0
+    for start in range(0, size, block):
+        hits += _extreme(
+            _stats(x, n1, rng, min(block, size - start)), observed,
+            alternative)
+    return hits
+
+
+def _exact(x: np.ndarray, n1: int, observed: float,
+           alternative: str) -> Tuple[int, int]:
+    """
+    :return: how many of all the permutations give a statistic at least
+    as extreme as observed, and how many permutations there are
+    """
+    n: int = x.size
+    if n1 == 0:
+        signs: np.ndarray = np.array(list(product((1, -1), repeat=n)))
+        stats: np.ndarray = signs @ x / n
+    else:
+        pick: np.ndarray = np.array(list(combinations(range(n), n1)))
+        s1: np.ndarray = x[pick].sum(axis=1)
+        stats = s1 / n1 - (x.sum() - s1) / (n - n1)
+    return _extreme(stats, observed, alternative), stats.size
+
+
+def _test(x: np.ndarray, n1: int, observed: float, nperm: int,
+          alternative: str, alpha: float, early_stop: bool, workers: int,
+          seed: int) -> summarise.PermutationTest:
+    """
+    :return: the permutation test of the statistic observed on x
+    """
+    if alternative not in ALTERNATIVES:
+        raise ValueError(f"alternative must be one of {ALTERNATIVES}")
+    n: int = x.size
+    total: int = 2**n if n1 == 0 else comb(n, n1)
+    if total <= EXACT_MAX:
+        hits, total = _exact(x, n1, observed, alternative)
+        return summarise.PermutationTest(observed, hits / total, total)
+    workers = workers or 1
+    # enough work per task to amortise a round trip to the pool
+    task: int = max(1, min(nperm, util.BLOCK_CELLS // n))
+    seeds: np.random.SeedSequence = np.random.SeedSequence(seed)
+    pool: Executor = util.executor(workers, (x, n1))
+    hits, done = 0, 0
+    settled: bool = False
+    try:
+        while done < nperm and not settled:
+            sizes = [
+                min(task, nperm - done - i * task) for i in range(workers)
+                if done + i * task < nperm]
+            args = [(s, size, observed, alternative)
+                    for s, size in zip(seeds.spawn(len(sizes)), sizes)]
+            # the stopping rule is applied task by task, in order, and
+            # the rest of the round discarded, so the result for a seed
+            # does not depend on workers
+            for size, count in zip(
+                    sizes, util.run(_count, (x, n1), args, pool)):
+                hits += count
+                done += size
+                if early_stop and _settled(hits, done, alpha):
+                    settled = True
+                    break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return summarise.PermutationTest(observed, (hits + 1) / (done + 1), done)
+
+
+def _settled(hits: int, done: int, alpha: float) -> bool:
+    """
+    :return: True once the Monte Carlo p-value is more than 3.29
+    standard errors (99.9% two-sided) from alpha
+    """
+    p: float = (hits + 1) / (done + 1)
+    return abs(p - alpha) > 3.29 * np.sqrt(alpha * (1 - alpha) / done)
+
+
+def two_sample(x1: np.ndarray, x2: np.ndarray, nperm: int = 1_000_000,
+               alternative: str = "two-sided", alpha: float = 0.05,
+               early_stop: bool = True, workers: int = None,
+               seed: int = None) -> summarise.PermutationTest:
+    """
+    A permutation test of equal means for two independent samples,
+    with the difference in means, mean(x1) - mean(x2), as statistic.
+    :param nperm: the most random permutations to draw, if the design is
+    too large to enumerate exactly (see EXACT_MAX)
+    :param alternative: "two-sided" counts permutations with a
+    statistic at least as large in absolute value as that observed
+    :param early_stop: stop drawing once the p-value is settled
+    relative to alpha
+    :param workers: processes to spread permutations over, 1 if None
+    :param seed: seeds every random stream, for reproducible results
+    :return: the observed difference, the p-value and the number of
+    permutations used
+    """
+    x1 = np.asarray(x1, dtype=np.float64).ravel()
+    x2 = np.asarray(x2, dtype=np.float64).ravel()
+    observed: float = float(x1.mean() - x2.mean())
+    return _test(np.concatenate([x1, x2]), x1.size, observed, nperm,
+                 alternative, alpha, early_stop, workers, seed)
+
+
+def paired(x1: np.ndarray, x2: np.ndarray = None, nperm: int = 1_000_000,
+           alternative: str = "two-sided", alpha: float = 0.05,
+           early_stop: bool = True, workers: int = None,
+           seed: int = None) -> summarise.PermutationTest:
+    """
+    A sign-flipping permutation test of zero mean difference for paired
+    samples, with the mean difference as statistic. Arguments are as
+    two_sample.
+    :param x2: the second sample, or None if x1 holds the differences
+    :return: the observed mean difference, the p-value and the number
+    of permutations used
+    """
+    d: np.ndarray = np.asarray(x1, dtype=np.float64).ravel()
+    if x2 is not None:
+        d = d - np.asarray(x2, dtype=np.float64).ravel()
+    return _test(d, 0, float(d.mean()), nperm, alternative, alpha,
+                 early_stop, workers, seed)
@@ -0,0 +1,335 @@
+"""
+A module of vectorised tests and intervals for proportions.
+Every function takes array-likes of counts and sizes and evaluates all
+of them in one NumPy pass, matching the scalar results of
+statsmodels.stats.proportion at each element.
+Exact (Clopper-Pearson and mid-p) intervals and exact binomial tests
+are evaluated the same way, by vectorised beta quantiles and root finding,
+so cells of a few trials and of millions share one batch.
+Results are returned as columnar pd.DataFrames; proportions() and
+tests() turn their rows into describe.Proportion and summarise.PropTest.
+"""
+
+from typing import Callable, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import special, stats
+
+from src import describe, summarise
+
+ALTERNATIVES: Tuple[str, ...] = ("two-sided", "larger", "smaller")
+# the relative precision of the mid-p bounds
+MIDP_TOL: float = 1e-13
+
+
+def _pval(zstat: np.ndarray, alternative: str) -> np.ndarray:
+    """
+    :return: the p-values of standard normal zstat under alternative
+    """
+    if alternative == "two-sided":
+        return 2 * special.ndtr(-np.abs(zstat))
+    if alternative == "larger":
+        return special.ndtr(-zstat)
+    if alternative == "smaller":
+        return special.ndtr(zstat)
+    raise ValueError(f"alternative must be one of {ALTERNATIVES}")
+
+
+def _beta(count: np.ndarray, nobs: np.ndarray,
+          q: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the lower and upper Clopper-Pearson bounds, each with tail
+    probability q
+    """
+    with np.errstate(invalid="ignore"):
+        lower: np.ndarray = np.where(
+            count > 0, special.betaincinv(count, nobs - count + 1, q), 0.0)
+        upper: np.ndarray = np.where(
+            count < nobs, special.betaincinv(count + 1, nobs - count, 1 - q),
+            1.0)
+    return lower, upper
+
+
+def _root(f: Callable[[np.ndarray, np.ndarray], np.ndarray],
+          lo: np.ndarray, hi: np.ndarray, tol: float) -> np.ndarray:
+    """
+    Finds the roots of increasing functions by the Illinois method,
+    evaluating only those not yet within tol (relative) of their root.
+    :param f: f(p, i), the functions at indices i, evaluated at p
+    :return: the roots in [lo, hi], where f changes sign, elementwise
+    """
+    lo, hi = lo.astype(np.float64), hi.astype(np.float64)
+    root: np.ndarray = (lo + hi) / 2
+    i: np.ndarray = np.arange(lo.size)
+    flo: np.ndarray = f(lo, i)
+    fhi: np.ndarray = f(hi, i)
+    side: np.ndarray = np.zeros(lo.size)
+    while i.size:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mid: np.ndarray = hi - fhi * (hi - lo) / (fhi - flo)
+        mid = np.where((mid > lo) & (mid < hi), mid, (lo + hi) / 2)
+        fmid: np.ndarray = f(mid, i)
+        root[i] = mid
+        above: np.ndarray = fmid > 0
+        # halve the value kept at the end that did not move twice running
+        flo = np.where(above & (side > 0), flo / 2, flo)
+        fhi = np.where(~above & (side < 0), fhi / 2, fhi)
+        lo, flo = np.where(above, lo, mid), np.where(above, flo, fmid)
+        hi, fhi = np.where(above, mid, hi), np.where(above, fmid, fhi)
+        side = np.where(above, 1.0, -1.0)
+        keep: np.ndarray = (hi - lo > tol * hi) & (fmid != 0)
+        i, lo, hi, flo, fhi, side = (
+            a[keep] for a in (i, lo, hi, flo, fhi, side))
+    return root
+
+
+def _midp(count: np.ndarray, nobs: np.ndarray,
+          alpha: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the lower and upper mid-p bounds, where half the
+    probability of the observed count counts toward each tail
+    """
+    shape: Tuple[int, ...] = np.broadcast(count, nobs).shape
+    count, nobs = (a.ravel() for a in np.broadcast_arrays(count, nobs))
+    q: float = alpha / 2
+    # P(X >= x) - P(X = x) / 2 lies between P(X >= x + 1) and P(X >= x),
+    # so each bound lies between those of two Clopper-Pearson intervals
+    outer_lo, outer_hi = _beta(count, nobs, q)
+    inner_lo, _ = _beta(count + 1, nobs, q)
+    _, inner_hi = _beta(count - 1, nobs, q)
+    lower: np.ndarray = np.zeros(count.shape)
+    upper: np.ndarray = np.ones(count.shape)
+
+    def tail(at: np.ndarray, level: float) -> Callable:
+        x, n = count[at], nobs[at]
+
+        def f(p: np.ndarray, i: np.ndarray) -> np.ndarray:
+            return stats.binom.sf(x[i], n[i], p) \
+                + stats.binom.pmf(x[i], n[i], p) / 2 - level
+        return f
+
+    at: np.ndarray = count > 0
+    # fmin and fmax pass over the bounds of counts beyond 0 and nobs
+    lower[at] = _root(tail(at, q), outer_lo[at],
+                      np.fmin(inner_lo, count / nobs)[at], MIDP_TOL)
+    at = count < nobs
+    upper[at] = _root(tail(at, 1 - q),
+                      np.fmax(inner_hi, count / nobs)[at], outer_hi[at],
+                      MIDP_TOL)
+    return lower.reshape(shape), upper.reshape(shape)
+
+
+def confint(count: np.ndarray, nobs: np.ndarray, alpha: float = 0.05,
+            method: str = "normal") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param method: "normal" (Wald), "wilson", "beta" (Clopper-Pearson,
+    exact) or "midp" (mid-p exact)
+    :return: the lower and upper bounds of the 1 - alpha confidence
+    interval for each proportion count / nobs
+    """
+    count = np.asarray(count, dtype=np.float64)
+    nobs = np.asarray(nobs, dtype=np.float64)
+    if method == "beta":
+        return _beta(count, nobs, alpha / 2)
+    if method == "midp":
+        return _midp(count, nobs, alpha)
+    q: float = -special.ndtri(alpha / 2)
+    p: np.ndarray = count / nobs
+    if method == "normal":
+        half: np.ndarray = q * np.sqrt(p * (1 - p) / nobs)
+        # clipped to [0, 1], as statsmodels
+        return np.clip(p - half, 0, 1), np.clip(p + half, 0, 1)
+    if method == "wilson":
+        q2: float = q * q
+        denom: np.ndarray = 1 + q2 / nobs
+        centre: np.ndarray = (p + q2 / (2 * nobs)) / denom
+        half = q / denom * np.sqrt(p * (1 - p) / nobs + q2 / (4 * nobs**2))
+        return np.clip(centre - half, 0, 1), np.clip(centre + half, 0, 1)
+    raise ValueError(
+        "method must be one of ('normal', 'wilson', 'beta', 'midp')")
+
+
+def ztest(count: np.ndarray, nobs: np.ndarray, value: float = 0.5,
+          alternative: str = "two-sided",
+          prop_var: float = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    A one-sample z-test of each proportion count / nobs == value, as
+    statsmodels proportions_ztest.
+    :param prop_var: the proportion used in the variance, count / nobs
+    if False
+    :return: the z statistics and p-values
+    """
+    count = np.asarray(count, dtype=np.float64)
+    nobs = np.asarray(nobs, dtype=np.float64)
+    p: np.ndarray = count / nobs
+    var: np.ndarray = p if prop_var is False else np.asarray(prop_var)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zstat: np.ndarray = (p - value) / np.sqrt(var * (1 - var) / nobs)
+    return zstat, _pval(zstat, alternative)
+
+
+def _search(pred: Callable[[np.ndarray], np.ndarray], lo: np.ndarray,
+            hi: np.ndarray, guess: np.ndarray) -> np.ndarray:
+    """
+    :return: the least integer in [lo, hi] at which the increasing
+    predicate pred holds, or hi + 1 if there is none, elementwise,
+    galloping out from guess before bisecting
+    """
+    guess = np.clip(guess, lo, hi)
+    up: np.ndarray = ~pred(guess)
+    # (a, b] holds the answer once pred fails at a and holds at b,
+    # taking it to fail below lo and hold above hi
+    a: np.ndarray = np.where(up, guess, guess - 1)
+    b: np.ndarray = np.where(up, guess + 1, guess)
+    step: np.ndarray = np.ones_like(guess)
+    moving: np.ndarray = np.where(up, b <= hi, a >= lo)
+    while moving.any():
+        holds: np.ndarray = pred(np.clip(np.where(up, b, a), lo, hi))
+        moving &= np.where(up, ~holds, holds)
+        step = np.where(moving, 2 * step, step)
+        a, b = (np.where(moving & up, b, np.where(moving, a - step, a)),
+                np.where(moving & up, b + step, np.where(moving, a, b)))
+        a, b = np.maximum(a, lo - 1), np.minimum(b, hi + 1)
+        moving &= np.where(up, b <= hi, a >= lo)
+    while (b - a > 1).any():
+        mid: np.ndarray = (a + b) // 2
+        holds = pred(mid)
+        wide: np.ndarray = b - a > 1
+        b = np.where(wide & holds, mid, b)
+        a = np.where(wide & ~holds, mid, a)
+    return b
+
+
+def binomtest(count: np.ndarray, nobs: np.ndarray, value: float = 0.5,
+              alternative: str = "two-sided") -> np.ndarray:
+    """
+    An exact binomial test of each proportion count / nobs == value, as
+    scipy.stats.binomtest; two-sided p-values sum the probabilities of
+    the counts no more likely than that observed.
+    :return: the p-values
+    """
+    count, nobs = np.broadcast_arrays(
+        np.asarray(count, dtype=np.int64), np.asarray(nobs, dtype=np.int64))
+    if alternative == "larger":
+        return stats.binom.sf(count - 1, nobs, value)
+    if alternative == "smaller":
+        return stats.binom.cdf(count, nobs, value)
+    if alternative != "two-sided":
+        raise ValueError(f"alternative must be one of {ALTERNATIVES}")
+    d: np.ndarray = stats.binom.pmf(count, nobs, value) * (1 + 1e-7)
+    mode: np.ndarray = value * nobs
+    low: np.ndarray = count < mode
+    # the counts as unlikely as that observed, beyond the opposite side
+    # of the mode; the pmf falls away from the mode on either side
+    start: np.ndarray = np.where(low, np.ceil(mode), 0).astype(np.int64)
+    stop: np.ndarray = np.where(low, nobs, np.floor(mode)).astype(np.int64)
+    # near the count mirrored in the mode at large nobs
+    edge: np.ndarray = _search(
+        lambda j: np.where(
+            low, stats.binom.pmf(j, nobs, value) <= d,
+            stats.binom.pmf(j, nobs, value) > d),
+        start, stop, np.round(2 * mode - count).astype(np.int64))
+    # the lower tail ends at count or before edge, the upper starts at
+    # edge or count; each tail costs an incomplete beta at large nobs
+    pval: np.ndarray = stats.binom.cdf(
+        np.where(low, count, edge - 1), nobs, value) + stats.binom.sf(
+        np.where(low, edge, count) - 1, nobs, value)
+    return np.where(count == mode, 1.0, np.minimum(1.0, pval))
+
+
+def ztest_2indep(count1: np.ndarray, nobs1: np.ndarray,
+                 count2: np.ndarray, nobs2: np.ndarray, value: float = 0,
+                 alternative: str = "two-sided",
+                 method: str = "agresti-caffo"
+                 ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    A two-sample z-test of each difference p1 - p2 == value.
+    :param method: "agresti-caffo" or "wald", as statsmodels
+    test_proportions_2indep, or "pooled" for the classic test on the
+    pooled proportion (value must be 0)
+    :return: the z statistics and p-values
+    """
+    count1 = np.asarray(count1, dtype=np.float64)
+    nobs1 = np.asarray(nobs1, dtype=np.float64)
+    count2 = np.asarray(count2, dtype=np.float64)
+    nobs2 = np.asarray(nobs2, dtype=np.float64)
+    if method == "pooled":
+        if value != 0:
+            raise ValueError("the pooled test requires value == 0")
+        pool: np.ndarray = (count1 + count2) / (nobs1 + nobs2)
+        diff: np.ndarray = count1 / nobs1 - count2 / nobs2
+        var: np.ndarray = pool * (1 - pool) * (1 / nobs1 + 1 / nobs2)
+    elif method in ("wald", "agresti-caffo"):
+        add: int = 1 if method == "agresti-caffo" else 0
+        p1: np.ndarray = (count1 + add) / (nobs1 + 2 * add)
+        p2: np.ndarray = (count2 + add) / (nobs2 + 2 * add)
+        diff = p1 - p2 - value
+        var = p1 * (1 - p1) / (nobs1 + 2 * add) \
+            + p2 * (1 - p2) / (nobs2 + 2 * add)
+    else:
+        raise ValueError(
+            "method must be one of ('agresti-caffo', 'wald', 'pooled')")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zstat: np.ndarray = diff / np.sqrt(var)
+    return zstat, _pval(zstat, alternative)
+
+
+def one_sample(count: np.ndarray, nobs: np.ndarray, value: float = 0.5,
+               alpha: float = 0.05, method: str = "normal",
+               alternative: str = "two-sided",
+               prop_var: float = False, exact: bool = False) -> pd.DataFrame:
+    """
+    Describes and tests every proportion count / nobs.
+    :param exact: take the p-values from the exact binomial test; zstat
+    is still the z statistic, for its sign and size
+    :return: a pd.DataFrame with columns count, nobs, p_hat, lower,
+    upper, zstat and pval, one row per proportion
+    """
+    count, nobs = np.broadcast_arrays(np.atleast_1d(count), nobs)
+    lower, upper = confint(count, nobs, alpha, method)
+    zstat, pval = ztest(count, nobs, value, alternative, prop_var)
+    if exact:
+        pval = binomtest(count, nobs, value, alternative)
+    return pd.DataFrame({
+        "count": count, "nobs": nobs, "p_hat": count / nobs,
+        "lower": lower, "upper": upper, "zstat": zstat, "pval": pval})
+
+
+def two_sample(count1: np.ndarray, nobs1: np.ndarray,
+               count2: np.ndarray, nobs2: np.ndarray, value: float = 0,
+               alternative: str = "two-sided",
+               method: str = "agresti-caffo") -> pd.DataFrame:
+    """
+    Tests every pair of proportions count1 / nobs1, count2 / nobs2.
+    :return: a pd.DataFrame with columns p_hat1, p_hat2, diff, zstat
+    and pval, one row per pair
+    """
+    count1, nobs1, count2, nobs2 = np.broadcast_arrays(
+        np.atleast_1d(count1), nobs1, count2, nobs2)
+    zstat, pval = ztest_2indep(
+        count1, nobs1, count2, nobs2, value, alternative, method)
+    p1: np.ndarray = count1 / nobs1
+    p2: np.ndarray = count2 / nobs2
+    return pd.DataFrame({
+        "p_hat1": p1, "p_hat2": p2, "diff": p1 - p2,
+        "zstat": zstat, "pval": pval})
+
+
+def proportions(table: pd.DataFrame) -> List[describe.Proportion]:
+    """
+    :return: a describe.Proportion for each row of a one_sample table
+    """
+    return [
+        describe.Proportion(p, (lo, hi))
+        for p, lo, hi in zip(table["p_hat"], table["lower"], table["upper"])]
+
+
+def tests(table: pd.DataFrame) -> List[summarise.PropTest]:
+    """
+    :return: a summarise.PropTest for each row of a one_sample or
+    two_sample table
+    """
+    return [
+        summarise.PropTest(z, p)
+        for z, p in zip(table["zstat"], table["pval"])]
@@ -0,0 +1,422 @@
+"""
+A module of rank-based nonparametric tests: Mann-Whitney U, Wilcoxon
+signed-rank and the sign test.
+All share one sort-based ranking kernel, which assigns mid-ranks to
+ties and returns the tie correction, and work on a batch of samples at
+once, one per row of a 2-d array, shorter samples padded with NaN.
+Exact null distributions are built once per sample size by recursive
+polynomial multiplication, vectorised over strides, and the *_counts
+variants take frequency tables, so samples accumulated chunk by chunk
+(see accumulate.Frequencies) need never be expanded.
+Results are returned as columnar pd.DataFrames; results() turns their
+rows into summarise.RankTest.
+"""
+
+from typing import Callable, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import special, stats
+
+from src import summarise, util
+from src.proportion import ALTERNATIVES
+
+# Mann-Whitney designs with n1 * n2 at most this use the exact
+# distribution when there are no ties
+EXACT_CELLS: int = 2_500
+# Wilcoxon samples of at most this size use the exact distribution
+# when there are no ties or zeros
+EXACT_N: int = 50
+# ... and, when there are, enumerate the signs of their ranks if they
+# have at most this size
+ENUMERATE_N: int = 13
+
+
+def rank(a: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ranks each row of a, from 1, giving ties their mean rank. NaN, the
+    padding of shorter rows, is left out and given rank NaN.
+    :return: the ranks, and the tie term sum(t**3 - t) over the groups
+    of t tied values of each row
+    """
+    a = np.atleast_2d(np.asarray(a, dtype=np.float64))
+    rows, n = a.shape
+    order: np.ndarray = np.argsort(a, axis=1, kind="stable")
+    s: np.ndarray = np.take_along_axis(a, order, axis=1)
+    # number the runs of equal values across the flattened rows
+    new: np.ndarray = np.ones((rows, n), dtype=bool)
+    new[:, 1:] = s[:, 1:] != s[:, :-1]
+    run: np.ndarray = np.cumsum(new.ravel()) - 1
+    size: np.ndarray = np.bincount(run)
+    end: np.ndarray = np.cumsum(size)
+    # the mean of positions end - size + 1 ... end, made relative to the
+    # start of the row
+    mid: np.ndarray = (end - (size - 1) / 2)[run] \
+        - np.repeat(np.arange(rows) * n, n)
+    ranks: np.ndarray = np.empty((rows, n))
+    np.put_along_axis(ranks, order, mid.reshape(rows, n), axis=1)
+    # NaN sorts last, each in a run of its own, so adds no ties
+    ranks[np.isnan(a)] = np.nan
+    row: np.ndarray = np.repeat(np.arange(rows), n)[new.ravel()]
+    ties: np.ndarray = np.bincount(
+        row, (size**3 - size).astype(np.float64), rows)
+    return ranks, ties
+
+
+def _counts_rank(counts: np.ndarray) -> np.ndarray:
+    """
+    :return: the mid-rank of each distinct value of a frequency table
+    sorted by value
+    """
+    return np.cumsum(counts) - (counts - 1) / 2
+
+
+def _divide(c: np.ndarray, i: int) -> np.ndarray:
+    """
+    :return: the coefficients c of a polynomial in q divided by
+    (1 - q**i), i.e. c[k] += c[k - i] for ascending k, done for every
+    residue class mod i at once
+    """
+    n: int = c.size
+    pad: int = -n % i
+    c = np.concatenate([c, np.zeros(pad)]).reshape(-1, i)
+    return np.cumsum(c, axis=0).ravel()[:n]
+
+
+def _mwu_pmf(n1: int, n2: int) -> np.ndarray:
+    """
+    :return: the null distribution of U for samples of n1 and n2, from
+    the generating function prod_i (1 - q**(n2 + i)) / (1 - q**i)
+    """
+    if n1 > n2:
+        n1, n2 = n2, n1
+    c: np.ndarray = np.zeros(n1 * n2 + 1)
+    c[0] = 1.0
+    for i in range(1, n1 + 1):
+        m: int = n2 + i
+        if m <= n1 * n2:
+            c[m:] -= c[:-m].copy()
+        c = _divide(c, i)
+    return c / c.sum()
+
+
+def _signrank_pmf(n: int) -> np.ndarray:
+    """
+    :return: the null distribution of W+ for a sample of n, from the
+    generating function prod_i (1 + q**i) / 2
+    """
+    c: np.ndarray = np.zeros(n * (n + 1) // 2 + 1)
+    c[0] = 1.0
+    for i in range(1, n + 1):
+        c[i:] = (c[i:] + c[:-i].copy()) / 2
+        c[:i] /= 2
+    return c
+
+
+def _exact_pval(pmf: np.ndarray, stat: np.ndarray,
+                alternative: str) -> np.ndarray:
+    """
+    :return: the p-values of statistics stat under pmf, the
+    distribution of an integer statistic
+    """
+    # a half-integer statistic, from tied ranks, is counted as the less
+    # extreme of its neighbours, as scipy
+    upper: np.ndarray = np.cumsum(pmf[::-1])[::-1][
+        np.floor(stat).astype(np.intp)]
+    lower: np.ndarray = np.cumsum(pmf)[np.ceil(stat).astype(np.intp)]
+    if alternative == "larger":
+        return upper
+    if alternative == "smaller":
+        return lower
+    return np.minimum(1.0, 2 * np.minimum(upper, lower))
+
+
+def _exact_by_size(pmf: Callable[..., np.ndarray], sizes: np.ndarray,
+                   stat: np.ndarray, alternative: str) -> np.ndarray:
+    """
+    :param sizes: the arguments of pmf for each statistic, one column
+    per argument
+    :return: the exact p-values of stat, building the distribution once
+    per distinct row of sizes
+    """
+    pval: np.ndarray = np.empty(stat.shape)
+    uniq, inverse = np.unique(sizes, axis=0, return_inverse=True)
+    for i, args in enumerate(uniq):
+        rows: np.ndarray = inverse.ravel() == i
+        pval[rows] = _exact_pval(pmf(*args), stat[rows], alternative)
+    return pval
+
+
+def _norm_pval(z: np.ndarray, alternative: str) -> np.ndarray:
+    """
+    :return: the standard normal p-values of z
+    """
+    if alternative == "larger":
+        return special.ndtr(-z)
+    if alternative == "smaller":
+        return special.ndtr(z)
+    return np.minimum(1.0, 2 * special.ndtr(-np.abs(z)))
+
+
+def _check(alternative: str, method: str) -> None:
+    if alternative not in ALTERNATIVES:
+        raise ValueError(f"alternative must be one of {ALTERNATIVES}")
+    if method not in ("auto", "exact", "asymptotic"):
+        raise ValueError(
+            "method must be one of ('auto', 'exact', 'asymptotic')")
+
+
+def _mwu(r1: np.ndarray, n1: np.ndarray, n2: np.ndarray, ties: np.ndarray,
+         alternative: str, method: str,
+         use_continuity: bool) -> pd.DataFrame:
+    """
+    :return: Mann-Whitney U tests from rank sums r1 of the first
+    samples, of sizes n1 and n2
+    """
+    r1, n1, n2, ties = np.broadcast_arrays(r1, n1, n2, ties)
+    u1: np.ndarray = r1 - n1 * (n1 + 1) / 2
+    empty: np.ndarray = (n1 == 0) | (n2 == 0)
+    exact: np.ndarray = np.full(u1.shape, method == "exact") & ~empty
+    if method == "auto":
+        exact = (ties == 0) & (n1 * n2 <= EXACT_CELLS) & ~empty
+    pval: np.ndarray = np.full(u1.shape, np.nan)
+    if exact.any():
+        pval[exact] = _exact_by_size(
+            _mwu_pmf, np.column_stack([n1[exact], n2[exact]]), u1[exact],
+            alternative)
+    rest: np.ndarray = ~exact & ~empty
+    if rest.any():
+        m1, m2 = n1[rest], n2[rest]
+        n: np.ndarray = m1 + m2
+        mu: np.ndarray = m1 * m2 / 2
+        sd: np.ndarray = np.sqrt(
+            m1 * m2 / 12 * ((n + 1) - ties[rest] / (n * (n - 1))))
+        cc: float = 0.5 if use_continuity else 0.0
+        u: np.ndarray = u1[rest]
+        if alternative == "two-sided":
+            z: np.ndarray = (np.maximum(u, m1 * m2 - u) - mu - cc) / sd
+        elif alternative == "larger":
+            z = (u - mu - cc) / sd
+        else:
+            z = -(m1 * m2 - u - mu - cc) / sd
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # the corrected z of a U at its mean is negative, not zero
+            pval[rest] = np.minimum(1.0, 2 * special.ndtr(-z)) \
+                if alternative == "two-sided" else _norm_pval(z, alternative)
+    return pd.DataFrame({"stat": u1, "pval": pval})
+
+
+def mannwhitneyu(x: np.ndarray, y: np.ndarray,
+                 alternative: str = "two-sided", method: str = "auto",
+                 use_continuity: bool = True) -> pd.DataFrame:
+    """
+    The Mann-Whitney U test of each row of x against the same row of y,
+    as scipy.stats.mannwhitneyu. Rows may hold samples of different
+    sizes, padded with NaN, which is left out.
+    :param method: "exact", "asymptotic" (with tie correction), or
+    "auto", exact when a row has no ties and n1 * n2 <= EXACT_CELLS
+    :return: a pd.DataFrame with columns stat (U of x) and pval, NaN
+    for an empty sample, one row per sample
+    """
+    _check(alternative, method)
+    x = np.atleast_2d(np.asarray(x, dtype=np.float64))
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    rows: int = max(x.shape[0], y.shape[0])
+    x = np.broadcast_to(x, (rows, x.shape[1]))
+    y = np.broadcast_to(y, (rows, y.shape[1]))
+    ranks, ties = rank(np.concatenate([x, y], axis=1))
+    return _mwu(np.nansum(ranks[:, :x.shape[1]], axis=1),
+                np.sum(~np.isnan(x), axis=1), np.sum(~np.isnan(y), axis=1),
+                ties, alternative, method, use_continuity)
+
+
+def mannwhitneyu_counts(values: np.ndarray, counts1: np.ndarray,
+                        counts2: np.ndarray, alternative: str = "two-sided",
+                        method: str = "auto",
+                        use_continuity: bool = True) -> pd.DataFrame:
+    """
+    mannwhitneyu from the frequency of each distinct value in the two
+    samples.
+    :return: a one row pd.DataFrame with columns stat and pval
+    """
+    _check(alternative, method)
+    order: np.ndarray = np.argsort(np.asarray(values), kind="stable")
+    c1: np.ndarray = np.asarray(counts1, dtype=np.float64)[order]
+    c2: np.ndarray = np.asarray(counts2, dtype=np.float64)[order]
+    total: np.ndarray = c1 + c2
+    mid: np.ndarray = _counts_rank(total)
+    ties: np.ndarray = np.array([np.sum(total**3 - total)])
+    return _mwu(np.array([np.dot(c1, mid)]), int(c1.sum()), int(c2.sum()),
+                ties, alternative, method, use_continuity)
+
+
+def _enumerate_pval(r: np.ndarray, observed: np.ndarray,
+                    alternative: str) -> np.ndarray:
+    """
+    :param r: the ranks of the nonzero differences, one row per sample,
+    all of the same size
+    :param observed: the sum of r over the positive differences, the
+    part of W+ that depends on the signs
+    :return: the p-values of observed from every assignment of signs
+    to r, exact under ties
+    """
+    m: int = r.shape[1]
+    signs: np.ndarray = ((np.arange(2**m)[:, None] >> np.arange(m)) & 1) \
+        .astype(np.float64)
+    pval: np.ndarray = np.empty(r.shape[0])
+    # a bounded block of samples at a time, each against every sign
+    block: int = max(1, util.BLOCK_CELLS // 2**m)
+    for start in range(0, r.shape[0], block):
+        part: slice = slice(start, start + block)
+        null: np.ndarray = r[part] @ signs.T
+        obs: np.ndarray = observed[part, None]
+        tol: np.ndarray = 1e-9 * np.maximum(1.0, np.abs(obs))
+        upper: np.ndarray = np.mean(null >= obs - tol, axis=1)
+        lower: np.ndarray = np.mean(null <= obs + tol, axis=1)
+        if alternative == "larger":
+            pval[part] = upper
+        elif alternative == "smaller":
+            pval[part] = lower
+        else:
+            pval[part] = np.minimum(1.0, 2 * np.minimum(upper, lower))
+    return pval
+
+
+def _signrank(d: np.ndarray, zero_method: str, alternative: str,
+              method: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param d: the differences, one sample per row, padded with NaN
+    :return: the Wilcoxon signed-rank statistics and p-values of each
+    row of d
+    """
+    dropped: np.ndarray = np.zeros(d.shape[0], dtype=np.intp)
+    if zero_method == "wilcox":
+        dropped = np.sum(d == 0, axis=1)
+        d = np.where(d == 0, np.nan, d)
+    valid: np.ndarray = ~np.isnan(d)
+    n: np.ndarray = valid.sum(axis=1)
+    r, ties = rank(np.abs(d))
+    r = np.where(valid, r, 0.0)
+    zero: np.ndarray = d == 0
+    zeros: np.ndarray = zero.sum(axis=1)
+    if zero_method == "pratt":
+        # the zeros are ranked, but do not count as ties
+        ties = ties - (zeros**3 - zeros)
+    r_plus: np.ndarray = np.sum(r * (d > 0), axis=1)
+    if zero_method == "zsplit":
+        r_plus = r_plus + np.sum(r * zero, axis=1) / 2
+    r_minus: np.ndarray = r.sum(axis=1) - r_plus
+    if zero_method == "pratt":
+        r_minus = r_minus - np.sum(r * zero, axis=1)
+    stat: np.ndarray = np.minimum(r_plus, r_minus) \
+        if alternative == "two-sided" else r_plus
+    exact: np.ndarray = np.full(n.shape, method == "exact")
+    enum: np.ndarray = np.zeros(n.shape, dtype=bool)
+    if method == "auto":
+        small: np.ndarray = n <= EXACT_N
+        exact = small & (ties == 0) & (zeros == 0) & (dropped == 0)
+        enum = small & ~exact & (n + dropped <= ENUMERATE_N)
+    exact &= n > 0
+    pval: np.ndarray = np.full(n.shape, np.nan)
+    if exact.any():
+        pval[exact] = _exact_by_size(
+            _signrank_pmf, n[exact, None], r_plus[exact], alternative)
+    # every sample of m nonzero differences enumerates the same signs
+    nonzero: np.ndarray = valid & ~zero
+    m: np.ndarray = nonzero.sum(axis=1)
+    for size in np.unique(m[enum]):
+        rows: np.ndarray = enum & (m == size)
+        first: np.ndarray = np.argsort(
+            ~nonzero[rows], axis=1, kind="stable")[:, :size]
+        rz: np.ndarray = np.take_along_axis(r[rows], first, axis=1)
+        pval[rows] = _enumerate_pval(
+            rz, np.sum(r[rows] * (d[rows] > 0), axis=1), alternative)
+    rest: np.ndarray = ~exact & ~enum & (n > 0)
+    if rest.any():
+        k, z0 = n[rest], zeros[rest]
+        mn: np.ndarray = k * (k + 1) / 4
+        var: np.ndarray = k * (k + 1) * (2 * k + 1) / 24
+        if zero_method == "pratt":
+            mn = mn - z0 * (z0 + 1) / 4
+            var = var - z0 * (z0 + 1) * (2 * z0 + 1) / 24
+        var = var - ties[rest] / 48
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pval[rest] = _norm_pval(
+                (r_plus[rest] - mn) / np.sqrt(var), alternative)
+    return stat, pval
+
+
+def wilcoxon(x: np.ndarray, y: np.ndarray = None,
+             zero_method: str = "wilcox", alternative: str = "two-sided",
+             method: str = "auto") -> pd.DataFrame:
+    """
+    The Wilcoxon signed-rank test of each row of x - y, or of x if y is
+    None, as scipy.stats.wilcoxon. Rows may hold samples of different
+    sizes, padded with NaN, which is left out.
+    :param zero_method: "wilcox" drops zero differences, "pratt" ranks
+    them but drops their ranks, "zsplit" splits their ranks between the
+    signs
+    :param method: "exact", "asymptotic", or "auto", as scipy; exact
+    when a row has at most EXACT_N differences and no ties or zeros,
+    else enumerating the signs of the ranks when it has at most
+    ENUMERATE_N, else asymptotic
+    :return: a pd.DataFrame with columns stat (min(W+, W-) if
+    two-sided, else W+), pval (NaN for an empty sample) and zeros, one
+    row per sample
+    """
+    _check(alternative, method)
+    if zero_method not in ("wilcox", "pratt", "zsplit"):
+        raise ValueError(
+            "zero_method must be one of ('wilcox', 'pratt', 'zsplit')")
+    d: np.ndarray = np.atleast_2d(np.asarray(x, dtype=np.float64))
+    if y is not None:
+        d = d - np.atleast_2d(np.asarray(y, dtype=np.float64))
+    stat, pval = _signrank(d, zero_method, alternative, method)
+    return pd.DataFrame({
+        "stat": stat, "pval": pval, "zeros": np.sum(d == 0, axis=1)})
+
+
+def sign_test(x: np.ndarray, y: np.ndarray = None,
+              alternative: str = "two-sided") -> pd.DataFrame:
+    """
+    The exact sign test of zero median for each row of x - y, or of x if
+    y is None, dropping zero differences.
+    :return: a pd.DataFrame with columns stat (the number of positive
+    differences), pval and zeros, one row per sample
+    """
+    d: np.ndarray = np.atleast_2d(np.asarray(x, dtype=np.float64))
+    if y is not None:
+        d = d - np.atleast_2d(np.asarray(y, dtype=np.float64))
+    return sign_counts(
+        np.sum(d > 0, axis=1), np.sum(d < 0, axis=1), alternative,
+        np.sum(d == 0, axis=1))
+
+
+def sign_counts(positive: np.ndarray, negative: np.ndarray,
+                alternative: str = "two-sided",
+                zeros: np.ndarray = 0) -> pd.DataFrame:
+    """
+    sign_test from the numbers of positive and negative differences.
+    :return: a pd.DataFrame with columns stat, pval and zeros
+    """
+    _check(alternative, "auto")
+    positive, negative, zeros = np.broadcast_arrays(
+        np.atleast_1d(positive), negative, zeros)
+    n: np.ndarray = positive + negative
+    upper: np.ndarray = stats.binom.sf(positive - 1, n, 0.5)
+    lower: np.ndarray = stats.binom.cdf(positive, n, 0.5)
+    if alternative == "larger":
+        pval: np.ndarray = upper
+    elif alternative == "smaller":
+        pval = lower
+    else:
+        pval = np.minimum(1.0, 2 * np.minimum(upper, lower))
+    return pd.DataFrame({"stat": positive, "pval": pval, "zeros": zeros})
+
+
+def results(table: pd.DataFrame) -> List[summarise.RankTest]:
+    """
+    :return: a summarise.RankTest for each row of a test table
+    """
+    return [
+        summarise.RankTest(s, p) for s, p in zip(table["stat"], table["pval"])]
@@ -0,0 +1,371 @@
+"""
+A module for least squares regression fitted from running sums, so
+samples too large to hold at once can be modelled chunk by chunk.
+Regression keeps the count, the means of the regressors and response,
+and their matrix of centred cross-products, combining chunks with the
+same pairwise update as accumulate.Moments; the raw sums X'X, X'y and
+y'y follow from these exactly, and stay accurate where summing them
+directly would cancel.
+Fits through the origin or with an intercept give coefficients,
+standard errors, t-tests and prediction intervals from the sums alone.
+Diagnostics are computed a chunk at a time from each row's own
+leverage, never the n x n hat matrix.
+Categorical regressors are one-hot encoded chunk by chunk against
+levels fixed up front, so memory grows with the number of features,
+never the number of rows.
+"""
+
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from src import load, summarise
+
+
+@dataclass
+class Regression():
+    """
+    A dataclass to hold the running moments of regressors X and
+    response y, for the model y = X b (+ const if intercept).
+    """
+    names: Tuple[str, ...] = ("x",)
+    intercept: bool = True
+    size: int = 0
+    mean: np.ndarray = None
+    comoment: np.ndarray = field(default=None, repr=False)
+
+    def update(self, x: np.ndarray, y: np.ndarray) -> "Regression":
+        """
+        folds the chunk of rows x (n, or n x k) and y (n) into the
+        running moments, ignoring rows with a NaN
+        :return: self, for chaining
+        """
+        z: np.ndarray = np.column_stack([
+            np.asarray(x, dtype=np.float64).reshape(len(y), -1),
+            np.asarray(y, dtype=np.float64)])
+        if z.shape[1] != len(self.names) + 1:
+            raise ValueError(
+                f"x must have {len(self.names)} columns, one per name")
+        z = z[~np.isnan(z).any(axis=1)]
+        if z.shape[0]:
+            mean: np.ndarray = z.mean(axis=0)
+            dev: np.ndarray = z - mean
+            self._combine(z.shape[0], mean, dev.T @ dev)
+        return self
+
+    def merge(self, other: "Regression") -> "Regression":
+        """
+        :return: the Regression of these rows and other's together
+        """
+        res: Regression = replace(self)
+        if self.size:
+            res.mean, res.comoment = self.mean.copy(), self.comoment.copy()
+        if other.size:
+            res._combine(other.size, other.mean, other.comoment)
+        return res
+
+    def __add__(self, other: "Regression") -> "Regression":
+        return self.merge(other)
+
+    def _combine(self, size: int, mean: np.ndarray,
+                 comoment: np.ndarray) -> None:
+        """
+        combines the moments of other rows into these
+        """
+        if not self.size:
+            self.size, self.mean, self.comoment = (
+                size, mean.copy(), comoment.copy())
+            return
+        total: int = self.size + size
+        delta: np.ndarray = mean - self.mean
+        self.comoment += comoment \
+            + np.outer(delta, delta) * self.size * size / total
+        self.mean += delta * size / total
+        self.size = total
+
+    def crossproducts(self) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        :return: X'X, X'y and y'y of the rows so far, X with a leading
+        column of ones if intercept
+        """
+        raw: np.ndarray = self.comoment + self.size * np.outer(
+            self.mean, self.mean)
+        if self.intercept:
+            sums: np.ndarray = self.size * self.mean
+            raw = np.block([
+                [np.array([[self.size]]), sums[None, :]],
+                [sums[:, None], raw]])
+        return raw[:-1, :-1], raw[:-1, -1], float(raw[-1, -1])
+
+    @property
+    def params(self) -> np.ndarray:
+        """
+        :return: the least squares coefficients, the intercept first
+        """
+        k: int = len(self.names)
+        if not self.intercept:
+            xtx, xty, _ = self.crossproducts()
+            return np.linalg.solve(xtx, xty)
+        cxx, cxy = self.comoment[:k, :k], self.comoment[:k, k]
+        slopes: np.ndarray = np.linalg.solve(cxx, cxy)
+        const: float = self.mean[k] - self.mean[:k] @ slopes
+        return np.concatenate([[const], slopes])
+
+    @property
+    def df_resid(self) -> int:
+        """
+        :return: the residual degrees of freedom
+        """
+        return self.size - len(self.names) - self.intercept
+
+    @property
+    def ssr(self) -> float:
+        """
+        :return: the sum of squared residuals
+        """
+        k: int = len(self.names)
+        b: np.ndarray = self.params
+        if not self.intercept:
+            _, xty, yty = self.crossproducts()
+            return float(yty - xty @ b)
+        return float(self.comoment[k, k] - self.comoment[:k, k] @ b[1:])
+
+    @property
+    def scale(self) -> float:
+        """
+        :return: the residual variance s**2
+        """
+        return self.ssr / self.df_resid
+
+    @property
+    def rsquared(self) -> float:
+        """
+        :return: R**2, uncentred for a fit through the origin, as
+        statsmodels
+        """
+        tss: float = self.comoment[-1, -1] if self.intercept \
+            else self.crossproducts()[2]
+        return 1 - self.ssr / tss
+
+    def _inverse(self) -> np.ndarray:
+        """
+        :return: the inverse of X'X, or, with an intercept, of the
+        centred cross-products of the regressors, which is better
+        conditioned
+        """
+        k: int = len(self.names)
+        if self.intercept:
+            return np.linalg.inv(self.comoment[:k, :k])
+        return np.linalg.inv(self.crossproducts()[0])
+
+    def _leverage(self, x: np.ndarray) -> np.ndarray:
+        """
+        :return: x_i' (X'X)^-1 x_i for each row x_i of regressors x,
+        with the leading one if intercept
+        """
+        x = np.asarray(x, dtype=np.float64).reshape(-1, len(self.names))
+        if self.intercept:
+            x = x - self.mean[:-1]
+        quad: np.ndarray = np.einsum("ij,jk,ik->i", x, self._inverse(), x)
+        return quad + 1 / self.size if self.intercept else quad
+
+    def cov_params(self) -> np.ndarray:
+        """
+        :return: the covariance matrix of the coefficients
+        """
+        inv: np.ndarray = self._inverse()
+        if self.intercept:
+            mu: np.ndarray = self.mean[:-1]
+            row: np.ndarray = -inv @ mu
+            inv = np.block([
+                [np.array([[1 / self.size + mu @ inv @ mu]]), row[None, :]],
+                [row[:, None], inv]])
+        return self.scale * inv
+
+    @property
+    def bse(self) -> np.ndarray:
+        """
+        :return: the standard errors of the coefficients
+        """
+        return np.sqrt(np.diag(self.cov_params()))
+
+    def summary(self, alpha: float = 0.05) -> pd.DataFrame:
+        """
+        :return: a pd.DataFrame with columns coef, std_err, tstat, pval,
+        lower and upper (the 1 - alpha interval), one row per
+        coefficient
+        """
+        b, se, dof = self.params, self.bse, self.df_resid
+        tstat: np.ndarray = b / se
+        q: float = stats.t(dof).isf(alpha / 2)
+        index: List[str] = (["const"] if self.intercept else []) \
+            + list(self.names)
+        return pd.DataFrame({
+            "coef": b, "std_err": se, "tstat": tstat,
+            "pval": 2 * stats.t(dof).sf(np.abs(tstat)),
+            "lower": b - q * se, "upper": b + q * se}, index=index)
+
+    def ttests(self) -> List[summarise.TTest]:
+        """
+        :return: a summarise.TTest of coefficient == 0 for each
+        coefficient, the intercept first
+        """
+        table: pd.DataFrame = self.summary()
+        return [
+            summarise.TTest(t, p, self.df_resid)
+            for t, p in zip(table["tstat"], table["pval"])]
+
+    def _design(self, x: np.ndarray) -> np.ndarray:
+        """
+        :return: x as rows of the design matrix
+        """
+        x = np.asarray(x, dtype=np.float64).reshape(-1, len(self.names))
+        if self.intercept:
+            x = np.column_stack([np.ones(x.shape[0]), x])
+        return x
+
+    def predict(self, x: np.ndarray, alpha: float = 0.05) -> pd.DataFrame:
+        """
+        Predicts the response at each row of x, e.g. a grid of values.
+        :return: a pd.DataFrame with columns mean, mean_se,
+        mean_ci_lower, mean_ci_upper, obs_ci_lower and obs_ci_upper, as
+        statsmodels get_prediction().summary_frame()
+        """
+        mean: np.ndarray = self._design(x) @ self.params
+        var: np.ndarray = self.scale * self._leverage(x)
+        q: float = stats.t(self.df_resid).isf(alpha / 2)
+        mean_se: np.ndarray = np.sqrt(var)
+        obs_se: np.ndarray = np.sqrt(var + self.scale)
+        return pd.DataFrame({
+            "mean": mean, "mean_se": mean_se,
+            "mean_ci_lower": mean - q * mean_se,
+            "mean_ci_upper": mean + q * mean_se,
+            "obs_ci_lower": mean - q * obs_se,
+            "obs_ci_upper": mean + q * obs_se})
+
+    def diagnostics(self, x: np.ndarray, y: np.ndarray) -> pd.DataFrame:
+        """
+        Diagnoses a chunk of the rows fitted, in time and memory
+        proportional to its length.
+        :return: a pd.DataFrame with columns fitted, resid, leverage (the
+        diagonal of the hat matrix), student (internally studentised
+        residuals) and cooks_d, one row per row of x
+        """
+        design: np.ndarray = self._design(x)
+        fitted: np.ndarray = design @ self.params
+        resid: np.ndarray = np.asarray(y, dtype=np.float64) - fitted
+        leverage: np.ndarray = self._leverage(x)
+        student: np.ndarray = resid / np.sqrt(self.scale * (1 - leverage))
+        return pd.DataFrame({
+            "fitted": fitted, "resid": resid, "leverage": leverage,
+            "student": student,
+            "cooks_d": student**2 * leverage / (
+                design.shape[1] * (1 - leverage))})
+
+    def from_chunks(chunks: Iterable, x: Sequence[str], y: str,
+                    intercept: bool = True) -> "Regression":
+        """
+        Fits a model to a table streamed in chunks, e.g. from
+        load.Data.blocks(tbl, [*x, y]) or load.Data.chunks(tbl).
+        :param x: the columns of the regressors
+        :param y: the column of the response
+        :return: the Regression of every chunk
+        """
+        acc: Regression = Regression(tuple(x), intercept)
+        for chunk in chunks:
+            acc.update(np.column_stack([chunk[c] for c in x]), chunk[y])
+        return acc
+
+
+def one_hot(values: Sequence[Any], levels: Sequence[Any]) -> np.ndarray:
+    """
+    :param levels: every level of values, the first the reference
+    :return: a 0/1 column for each level but the first, one row per
+    value
+    """
+    values = np.asarray(values).ravel()
+    levels = np.asarray(levels)
+    unknown: np.ndarray = ~np.isin(values, levels)
+    if unknown.any():
+        raise ValueError(
+            f"values {np.unique(values[unknown]).tolist()} are not levels")
+    return (values[:, None] == levels[None, 1:]).astype(np.float64)
+
+
+def design(chunk: Any, numeric: Sequence[str] = (),
+           categorical: Dict[str, Sequence[Any]] = None) -> np.ndarray:
+    """
+    :param chunk: a pd.DataFrame or dict of column name -> np.ndarray
+    :param numeric: the columns to use as they are
+    :param categorical: a dict of column -> its levels, each column one-hot
+    encoded against its first level
+    :return: the regressors of the rows of chunk, in the order of names()
+    """
+    categorical = categorical or {}
+    cols: List[np.ndarray] = [
+        np.asarray(chunk[c], dtype=np.float64)[:, None] for c in numeric]
+    cols += [one_hot(chunk[c], lv) for c, lv in categorical.items()]
+    return np.hstack(cols)
+
+
+def names(numeric: Sequence[str] = (),
+          categorical: Dict[str, Sequence[Any]] = None) -> Tuple[str, ...]:
+    """
+    :return: the name of each column of design(), e.g. season[2]
+    """
+    categorical = categorical or {}
+    return tuple(numeric) + tuple(
+        f"{c}[{level}]" for c, lv in categorical.items() for level in lv[1:])
+
+
+def levels(tbl: str, columns: Sequence[str],
+           where: Union[str, Dict[str, Any]] = None,
+           params: Sequence[Any] = ()) -> Dict[str, List[Any]]:
+    """
+    :return: a dict of column -> its distinct values in tbl, sorted,
+    found by GROUP BY inside sqlite
+    """
+    return {
+        c: load.Data.aggregate(tbl, c, {}, (), where, params)[c].tolist()
+        for c in columns}
+
+
+def fit(chunks: Iterable, y: str, numeric: Sequence[str] = (),
+        categorical: Dict[str, Sequence[Any]] = None,
+        intercept: bool = True) -> Regression:
+    """
+    Fits a multiple regression to a table streamed in chunks, e.g. from
+    load.Data.blocks or pd.read_csv(..., chunksize=...).
+    :param y: the column of the response
+    :param categorical: a dict of column -> its levels, see design()
+    :return: the Regression of every chunk
+    """
+    acc: Regression = Regression(names(numeric, categorical), intercept)
+    for chunk in chunks:
+        acc.update(design(chunk, numeric, categorical), chunk[y])
+    return acc
+
+
+def fit_table(tbl: str, y: str, numeric: Sequence[str] = (),
+              categorical: Sequence[str] = (),
+              where: Union[str, Dict[str, Any]] = None,
+              params: Sequence[Any] = (), intercept: bool = True,
+              size: int = None) -> Regression:
+    """
+    Fits a multiple regression to a table of the database, streaming
+    size rows at a time, e.g. after
+    Ingest.csv("..\\data\\bike_rental_daily.csv"),
+    fit_table("bike_rental_daily", "dailycount",
+    ["temp", "hum", "windspeed"], ["season", "weathersit"]).
+    :param categorical: the columns to one-hot encode against their
+    levels in tbl, the smallest the reference
+    :return: the Regression of the rows of tbl
+    """
+    lv: Dict[str, List[Any]] = levels(tbl, categorical, where, params)
+    return fit(
+        load.Data.blocks(tbl, [*numeric, *categorical, y], where, params,
+                         size),
+        y, numeric, lv, intercept)
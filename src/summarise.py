@@ -72,3 +72,53 @@ class ChisqGoodnessOfFit():
             f"chisq={self.chisq:.6f}"
             f", pval={self.pval:.6f}"
             f", dof={self.dof})")
+
+
+@dataclass
+class PermutationTest():
+    """
+    A dataclass to hold the results of a permutation test
+    """
+    stat: float
+    pval: float
+    nperm: int
+
+    def __repr__(self) -> str:
+        return (
+            f"ResultSummary("
+            f"stat={self.stat:.6f}"
+            f", pval={self.pval:.6f}"
+            f", nperm={int(self.nperm)})")
+
+
+@dataclass
+class RankTest():
+    """
+    A dataclass to hold the results of a rank-based test
+    """
+    stat: float
+    pval: float
+
+    def __repr__(self) -> str:
+        return (
+            f"ResultSummary("
+            f"stat={self.stat:.6f}"
+            f", pval={self.pval:.6f})")
+
+
+@dataclass
+class ContingencyTest():
+    """
+    A dataclass to hold the results of a test of independence in a
+    contingency table
+    """
+    stat: float
+    pval: float
+    dof: int
+
+    def __repr__(self) -> str:
+        return (
+            f"ResultSummary("
+            f"stat={self.stat:.6f}"
+            f", pval={self.pval:.6f}"
+            f", dof={int(self.dof)})")
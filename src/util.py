@@ -0,0 +1,48 @@
+"""
+A module of the process pool scaffolding shared by the resampling
+modules, permutation and bootstrap.
+A sample is sent to each worker process once, by the pool initializer,
+rather than with every task. Without a pool, tasks take the sample as
+an argument, so nothing outlives the call or is shared between threads.
+"""
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Callable, List, Sequence
+
+# the most random numbers generated at once per block of resamples
+BLOCK_CELLS: int = 2**22
+
+# the sample of a worker process, set once by _init
+_data: Any = None
+
+
+def _init(data: Any) -> None:
+    global _data
+    _data = data
+
+
+def _call(func: Callable[..., Any], *args: Any) -> Any:
+    return func(_data, *args)
+
+
+def executor(workers: int, data: Any) -> Executor:
+    """
+    :return: a process pool of workers, each holding data, or None if
+    workers is at most 1
+    """
+    if not workers or workers <= 1:
+        return None
+    return ProcessPoolExecutor(workers, initializer=_init, initargs=(data,))
+
+
+def run(func: Callable[..., Any], data: Any, tasks: Sequence[tuple],
+        pool: Executor = None) -> List[Any]:
+    """
+    :param func: a picklable, module-level function of (data, *task)
+    :param pool: from executor(), holding data, or None to run in turn
+    :return: func applied to data and each of tasks, in order
+    """
+    if pool is None:
+        return [func(data, *task) for task in tasks]
+    return list(pool.map(_call, repeat(func), *zip(*tasks)))